@@ -1,7 +1,62 @@
-from typing import List, Dict, Union, Any
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from collections import OrderedDict
+import hashlib
+import struct
 import numpy as np
 
-NestedDict = Dict[int, Union["NestedDict", int]]
+# Parameters of the interleaved range coder (rANS). Each lane keeps its state
+# in [_RANS_L, 2**32) and renormalizes by emitting/consuming 16-bit words, so
+# at most one word is moved per lane and per symbol.
+_RANS_L = 1 << 16
+_RANS_WORD_BITS = 16
+_default_scale_bits = 15
+_max_scale_bits = 16
+# Larger alphabets keep their most frequent symbols and code the others with
+# an escape symbol followed by the raw value
+_max_alphabet_size = 1 << (_max_scale_bits - 1)
+# Number of symbols handled by each lane. Lanes are advanced in lock-step with
+# NumPy, so longer signals get more lanes rather than longer Python loops.
+_default_lane_length = 2048
+# Above this value range the symbol lookup uses np.searchsorted instead of a
+# dense table
+_max_dense_lookup_size = 1 << 20
+
+# Number of symbols per frame in encode_stream
+_default_stream_block_size = 1 << 20
+
+# Maximum number of distinct histograms whose codec tables are kept in memory
+_max_codec_table_cache_size = 64
+
+_payload_header = struct.Struct("<QIQ")  # number of symbols, number of lanes, number of escapes
+_frame_header = struct.Struct("<I")  # payload size of a frame in encode_stream
+
+# Serialized frequency model: magic, format version, flags, output dtype,
+# number of symbols. The sorted symbols and their counts follow.
+_model_magic = b"ACMD"
+_model_version = 1
+_model_header = struct.Struct("<4sBB4sI")
+_model_flag_symbols_int64 = 1
+_model_flag_counts_uint64 = 2
+# Size in bytes of the codebook id that prefixes CodebookRegistry payloads
+_codebook_id_size = 8
+
+# Adaptive mode (AdaptiveArithmeticCompressor). Each context codes the value
+# range of its data, plus an escape symbol for outliers when that range is
+# too wide. The model is updated after periods of symbols that start short
+# and double up to a maximum, so small contexts adapt quickly.
+_adaptive_scale_bits = 15
+_max_adaptive_alphabet_size = 4096
+_default_adaptive_increment = 16
+_default_adaptive_max_total = 1 << 20
+_adaptive_first_period = 256
+_adaptive_max_period = 1 << 16
+_adaptive_magic = b"ACAD"
+_adaptive_version = 1
+_adaptive_header = struct.Struct("<4sBI")  # magic, format version, number of contexts
+# number of symbols, number of lanes, number of escapes, number of words,
+# lowest and highest coded value, dtype
+_context_header = struct.Struct("<QIQQqq4s")
+
 
 class ArithmeticCompressor:
     def __init__(self, data: Any):
@@ -10,151 +65,789 @@ class ArithmeticCompressor:
         Args:
             data: Training data (numpy array or list) to build frequency model
         """
-        # Convert to list if numpy array
+        self._dtype = np.dtype(np.int16)
         if isinstance(data, np.ndarray):
-            data = data.tolist()
+            if np.issubdtype(data.dtype, np.integer) and data.dtype.itemsize > 2:
+                self._dtype = data.dtype
 
         # Calculate frequencies
-        self._data_counts: Dict[int, int] = {}
-        for v in data:
-            if v in self._data_counts:
-                self._data_counts[v] += 1
-            else:
-                self._data_counts[v] = 1
-        # Add end marker
-        self._data_counts[-1] = 1
-
-        total_counts = sum(self._data_counts.values())
-        self._frequencies = {k: v / total_counts for k, v in self._data_counts.items()}
-
-        # Create codec with reasonable range (can be adjusted if needed)
-        self._decoder_table, self._encoder_tree = self._create_codec(0, 64000, self._frequencies)
-
-    def encode(self, data: Any):
+        symbols, counts = np.unique(np.asarray(data).ravel(), return_counts=True)
+        if len(symbols) == 0:
+            raise ValueError("Cannot build a frequency model from empty data")
+        self._set_tables(_get_codec_tables(symbols.astype(np.int64), counts.astype(np.int64)))
+
+    @classmethod
+    def from_counts(cls, symbols: Any, counts: Any, *, dtype: Any = np.int16) -> "ArithmeticCompressor":
+        """Create a compressor from a histogram rather than from training data
+
+        Args:
+            symbols: Strictly increasing array of distinct symbols
+            counts: Positive number of occurrences of each symbol
+            dtype: Integer dtype of the decoded data
+
+        Returns:
+            The compressor
+        """
+        symbols = np.asarray(symbols, dtype=np.int64).ravel()
+        counts = np.asarray(counts, dtype=np.int64).ravel()
+        if len(symbols) == 0 or len(symbols) != len(counts):
+            raise ValueError("symbols and counts must be non-empty and of the same length")
+        if np.any(np.diff(symbols) <= 0):
+            raise ValueError("symbols must be strictly increasing")
+        if np.any(counts <= 0):
+            raise ValueError("counts must be positive")
+        ret = cls.__new__(cls)
+        ret._dtype = np.dtype(dtype)
+        ret._set_tables(_get_codec_tables(symbols, counts))
+        return ret
+
+    def to_bytes(self) -> bytes:
+        """Serialize the frequency model (not the tables, which are rebuilt on load)
+
+        Returns:
+            The serialized model, readable by from_bytes
+        """
+        flags = 0
+        symbols_dtype = "<i4"
+        counts_dtype = "<u4"
+        if not _fits_int32(self._symbols):
+            flags |= _model_flag_symbols_int64
+            symbols_dtype = "<i8"
+        if int(self._counts.max()) > np.iinfo(np.uint32).max:
+            flags |= _model_flag_counts_uint64
+            counts_dtype = "<u8"
+        return b"".join([
+            _model_header.pack(
+                _model_magic, _model_version, flags,
+                self._dtype.str.encode().ljust(4), len(self._symbols)
+            ),
+            self._symbols.astype(symbols_dtype).tobytes(),
+            self._counts.astype(counts_dtype).tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ArithmeticCompressor":
+        """Load a frequency model serialized by to_bytes
+
+        Args:
+            data: The serialized model
+
+        Returns:
+            The compressor
+        """
+        data = memoryview(data).cast("B")
+        if len(data) < _model_header.size:
+            raise ValueError("Serialized model is too short")
+        magic, version, flags, dtype_str, num_symbols = _model_header.unpack_from(data, 0)
+        if magic != _model_magic:
+            raise ValueError("Not a serialized ArithmeticCompressor model")
+        if version != _model_version:
+            raise ValueError(f"Unsupported model version: {version}")
+        symbols_dtype = np.dtype("<i8" if flags & _model_flag_symbols_int64 else "<i4")
+        counts_dtype = np.dtype("<u8" if flags & _model_flag_counts_uint64 else "<u4")
+        offset = _model_header.size
+        if len(data) != offset + num_symbols * (symbols_dtype.itemsize + counts_dtype.itemsize):
+            raise ValueError("Serialized model has an invalid length")
+        symbols = np.frombuffer(data, dtype=symbols_dtype, count=num_symbols, offset=offset)
+        offset += symbols_dtype.itemsize * num_symbols
+        counts = np.frombuffer(data, dtype=counts_dtype, count=num_symbols, offset=offset)
+        return cls.from_counts(symbols, counts, dtype=np.dtype(dtype_str.decode().strip()))
+
+    @property
+    def model_id(self) -> str:
+        """Identifier of the frequency model, derived from its serialized form"""
+        return hashlib.sha1(self.to_bytes()).hexdigest()[:2 * _codebook_id_size]
+
+    def encode(self, data: Any) -> bytes:
         """Encode the input data using arithmetic coding
 
         Args:
             data: Data to encode (numpy array or list)
 
         Returns:
-            List of encoded integers
+            The encoded bytes
         """
-        if isinstance(data, np.ndarray):
-            data = data.tolist()
-        return self._encode_signal(data, self._encoder_tree)
+        return self._encode_values(np.asarray(data))
 
-    def decode(self, encoded_data):
+    def decode(self, encoded_data: bytes) -> np.ndarray:
         """Decode the encoded data back to original form
 
         Args:
-            encoded_data: List of encoded integers
+            encoded_data: Bytes returned by encode
 
         Returns:
-            List of decoded values
-        """
-        return self._decode_signal(encoded_data, self._decoder_table)
-
-    def _create_codec(self, n1: int, n2: int, frequencies: dict):
-        """Create encoder tree and decoder table"""
-        decoder_table: Dict[int, List[int]] = {}
-        encoder_tree: NestedDict = {}
-        stack = []
-        keys = list(frequencies.keys())
-
-        for i in range(len(keys)):
-            stack.append((n1, n2, [], encoder_tree))
-
-        while stack:
-            start, end, prefix, encoder_subtree = stack.pop()
-            divider_points = self._get_divider_points(keys, frequencies, start, end)
-
-            for i in range(len(keys)):
-                a1 = divider_points[i]["start"]
-                a2 = divider_points[i]["end"]
-                if len(keys) > a2 - a1 or keys[i] == -1:
-                    decoder_table[a1] = prefix + [keys[i]]
-                    encoder_subtree[keys[i]] = divider_points[i]["start"]
-                else:
-                    encoder_subtree[keys[i]] = {}
-                    stack.append(
-                        (
-                            divider_points[i]["start"],
-                            divider_points[i]["end"],
-                            prefix + [keys[i]],
-                            encoder_subtree[keys[i]],
-                        )
-                    )
-
-        return decoder_table, encoder_tree
-
-    def _get_divider_points(self, keys, frequencies, a1, a2):
-        """Calculate divider points for the range"""
-        divider_points = {}
-        partition = self._get_partition(a2 - a1, [frequencies[k] for k in keys])
-        offset = a1
-
-        for i in range(len(keys)):
-            divider_points[i] = {
-                "start": offset,
-                "end": offset + partition[i],
-            }
-            if i == len(keys) - 1:
-                divider_points[i]["end"] = a2
-            offset = divider_points[i]["end"]
-
-        return divider_points
-
-    def _get_partition(self, n: int, frequencies: List[float]) -> List[int]:
-        """Get integer partition based on frequencies"""
-        partition = [int(np.floor(f * n)) for f in frequencies]
-
-        # Ensure positive values
-        for i in range(len(partition)):
-            if partition[i] == 0:
-                partition[i] = 1
-
-        # Adjust to sum to n
-        while sum(partition) < n:
-            partition[0] += 1
-        while sum(partition) > n:
-            found = False
-            for i in range(len(partition)):
-                if partition[i] > 1:
-                    found = True
-                    partition[i] -= 1
+            Array of decoded values
+        """
+        return self._decode_values(encoded_data).astype(self._dtype)
+
+    def encode_stream(self, chunks: Iterable[Any], *, block_size: int = _default_stream_block_size) -> Iterator[bytes]:
+        """Encode a stream of data chunks into a stream of frames
+
+        Incoming samples are buffered into blocks of block_size samples,
+        regardless of how the input is chunked, and each block is emitted as
+        a self-delimiting frame as soon as it is full. Memory use is therefore
+        bounded by the block size rather than by the length of the stream.
+
+        Args:
+            chunks: Iterable of data chunks (numpy arrays or lists)
+            block_size: Number of samples per frame
+
+        Yields:
+            Encoded frames. Their concatenation can be passed to decode_stream
+            in arbitrary pieces.
+        """
+        if block_size <= 0:
+            raise ValueError("block_size must be positive")
+        pending = np.zeros(block_size, dtype=np.int64)
+        num_pending = 0
+        for chunk in chunks:
+            values = np.asarray(chunk).ravel()
+            pos = 0
+            while pos < len(values):
+                k = min(block_size - num_pending, len(values) - pos)
+                pending[num_pending:num_pending + k] = values[pos:pos + k]
+                num_pending += k
+                pos += k
+                if num_pending == block_size:
+                    yield self._encode_frame(pending)
+                    num_pending = 0
+        if num_pending > 0:
+            yield self._encode_frame(pending[:num_pending])
+
+    def decode_stream(self, byte_chunks: Iterable[bytes]) -> Iterator[np.ndarray]:
+        """Decode a stream produced by encode_stream
+
+        Args:
+            byte_chunks: Iterable of byte chunks. Frames may be split across
+                chunks in any way.
+
+        Yields:
+            Arrays of decoded values, one per frame
+        """
+        buf = bytearray()
+        for chunk in byte_chunks:
+            buf.extend(chunk)
+            offset = 0
+            while len(buf) - offset >= _frame_header.size:
+                (payload_size,) = _frame_header.unpack_from(buf, offset)
+                frame_end = offset + _frame_header.size + payload_size
+                if frame_end > len(buf):
                     break
-            if not found:
-                raise ValueError("Partitioning failed")
+                payload = bytes(buf[offset + _frame_header.size:frame_end])
+                yield self._decode_values(payload).astype(self._dtype)
+                offset = frame_end
+            del buf[:offset]
+        if len(buf) > 0:
+            raise ValueError("Encoded stream ends with an incomplete frame")
+
+    def _encode_frame(self, values: np.ndarray) -> bytes:
+        payload = self._encode_values(values)
+        return _frame_header.pack(len(payload)) + payload
+
+    def _encode_values(self, values: np.ndarray) -> bytes:
+        """Encode values into a payload (header, lane states, escaped values, words)"""
+        indices, escapes = self._symbols_to_indices(values)
+        num_lanes = _get_num_lanes(len(indices))
+        states, words = _rans_encode(self._freq[indices], self._cum[indices], self._scale_bits, num_lanes)
+        return b"".join([
+            _payload_header.pack(len(indices), num_lanes, len(escapes)),
+            states.astype("<u4").tobytes(),
+            escapes.astype(self._escape_dtype).tobytes(),
+            words.astype("<u2").tobytes(),
+        ])
+
+    def _decode_values(self, encoded_data: bytes) -> np.ndarray:
+        """Decode a payload produced by _encode_values"""
+        encoded_data = memoryview(encoded_data).cast("B")
+        if len(encoded_data) < _payload_header.size:
+            raise ValueError("Encoded data is too short")
+        num_symbols, num_lanes, num_escapes = _payload_header.unpack_from(encoded_data, 0)
+        offset = _payload_header.size
+        escapes_size = self._escape_dtype.itemsize * num_escapes
+        if len(encoded_data) < offset + 4 * num_lanes + escapes_size:
+            raise ValueError("Encoded data is too short")
+        states = np.frombuffer(encoded_data, dtype="<u4", count=num_lanes, offset=offset)
+        offset += 4 * num_lanes
+        escapes = np.frombuffer(encoded_data, dtype=self._escape_dtype, count=num_escapes, offset=offset)
+        offset += escapes_size
+        if (len(encoded_data) - offset) % 2 != 0:
+            raise ValueError("Encoded data has an invalid length")
+        words = np.frombuffer(encoded_data, dtype="<u2", offset=offset)
+        indices = _rans_decode(
+            states, words, num_symbols,
+            self._freq, self._cum, self._slot_to_index, self._scale_bits
+        )
+        values = self._coder_symbols[indices]
+        if self._escape_index >= 0:
+            escaped = indices == self._escape_index
+            if np.count_nonzero(escaped) != num_escapes:
+                raise ValueError("Encoded data is corrupted")
+            values[escaped] = escapes
+        elif num_escapes > 0:
+            raise ValueError("Encoded data is corrupted")
+        return values
+
+    def _set_tables(self, tables: dict):
+        """Use the codec tables returned by _get_codec_tables"""
+        self._model_hash: str = tables["hash"]
+        self._symbols: np.ndarray = tables["symbols"]
+        self._counts: np.ndarray = tables["counts"]
+        self._coder_index: np.ndarray = tables["coder_index"]
+        self._coder_symbols: np.ndarray = tables["coder_symbols"]
+        self._escape_index: int = tables["escape_index"]
+        self._escape_dtype: np.dtype = tables["escape_dtype"]
+        self._scale_bits: int = tables["scale_bits"]
+        self._freq: np.ndarray = tables["freq"]
+        self._cum: np.ndarray = tables["cum"]
+        self._slot_to_index: np.ndarray = tables["slot_to_index"]
+        self._lookup_offset: int = tables["lookup_offset"]
+        self._symbol_to_index: Any = tables["symbol_to_index"]
+
+    def _symbols_to_indices(self, data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Map symbol values to their index in the frequency tables
+
+        Returns:
+            The coder indices, and the values that were mapped to the escape
+            symbol (in order)
+        """
+        data = data.ravel().astype(np.int64, copy=False)
+        if len(data) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.int64)
+        if self._symbol_to_index is not None:
+            rel = data - self._lookup_offset
+            if np.any(rel < 0) or np.any(rel >= len(self._symbol_to_index)):
+                raise ValueError("Data contains symbols that are not in the frequency model")
+            indices = self._symbol_to_index[rel]
+            if np.any(indices < 0):
+                raise ValueError("Data contains symbols that are not in the frequency model")
+        else:
+            positions = np.searchsorted(self._symbols, data)
+            positions[positions == len(self._symbols)] = 0
+            if np.any(self._symbols[positions] != data):
+                raise ValueError("Data contains symbols that are not in the frequency model")
+            indices = self._coder_index[positions]
+        if self._escape_index >= 0:
+            escapes = data[indices == self._escape_index]
+        else:
+            escapes = np.zeros(0, dtype=np.int64)
+        return indices, escapes
+
+
+class CodebookRegistry:
+    def __init__(self):
+        """A set of shared frequency models (codebooks)
+
+        A single model can then be applied to many channels or segments. The
+        models are stored once, for example with to_bytes, and each payload
+        only carries the id of the codebook that encoded it.
+        """
+        self._codebooks: Dict[str, ArithmeticCompressor] = {}
+
+    def register(self, compressor: ArithmeticCompressor) -> str:
+        """Add a codebook to the registry
+
+        Args:
+            compressor: The compressor whose model is shared
+
+        Returns:
+            The codebook id
+        """
+        codebook_id = compressor.model_id
+        if codebook_id not in self._codebooks:
+            self._codebooks[codebook_id] = compressor
+        return codebook_id
+
+    def train(self, data: Any) -> str:
+        """Build a codebook from training data and add it to the registry
+
+        Returns:
+            The codebook id
+        """
+        return self.register(ArithmeticCompressor(data))
+
+    def get(self, codebook_id: str) -> ArithmeticCompressor:
+        if codebook_id not in self._codebooks:
+            raise KeyError(f"Unknown codebook: {codebook_id}")
+        return self._codebooks[codebook_id]
+
+    def __contains__(self, codebook_id: str) -> bool:
+        return codebook_id in self._codebooks
+
+    def __len__(self) -> int:
+        return len(self._codebooks)
 
-        return partition
+    def encode(self, data: Any, codebook_id: str) -> bytes:
+        """Encode data with a registered codebook
+
+        Args:
+            data: Data to encode (numpy array or list)
+            codebook_id: Id of the codebook to use
+
+        Returns:
+            The codebook id followed by the encoded bytes
+        """
+        return bytes.fromhex(codebook_id) + self.get(codebook_id).encode(data)
+
+    def decode(self, encoded_data: bytes) -> np.ndarray:
+        """Decode data produced by encode, looking up the codebook from its id"""
+        encoded_data = memoryview(encoded_data).cast("B")
+        if len(encoded_data) < _codebook_id_size:
+            raise ValueError("Encoded data is too short")
+        codebook_id = bytes(encoded_data[:_codebook_id_size]).hex()
+        return self.get(codebook_id).decode(encoded_data[_codebook_id_size:])
+
+    def to_bytes(self) -> bytes:
+        """Serialize all codebooks in the registry"""
+        parts = [struct.pack("<I", len(self._codebooks))]
+        for compressor in self._codebooks.values():
+            model = compressor.to_bytes()
+            parts.append(struct.pack("<I", len(model)))
+            parts.append(model)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CodebookRegistry":
+        """Load a registry serialized by to_bytes"""
+        data = memoryview(data).cast("B")
+        ret = cls()
+        (num_codebooks,) = struct.unpack_from("<I", data, 0)
+        offset = 4
+        for _ in range(num_codebooks):
+            (model_size,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            if offset + model_size > len(data):
+                raise ValueError("Serialized registry is truncated")
+            ret.register(ArithmeticCompressor.from_bytes(data[offset:offset + model_size]))
+            offset += model_size
+        return ret
+
+
+class AdaptiveArithmeticCompressor:
+    def __init__(
+        self,
+        *,
+        increment: int = _default_adaptive_increment,
+        max_total: int = _default_adaptive_max_total
+    ):
+        """Arithmetic coder with one adaptive frequency model per context
+
+        Intended for data whose statistics differ between parts, such as the
+        quantized coefficients of the individual levels of a wavelet
+        decomposition. Each context (for example each level) is coded with
+        its own model, which starts uniform over the value range of the
+        context and is updated with the counts of the symbols coded so far.
+        No training data is needed and no model is stored in the payload.
+
+        Args:
+            increment: Count added for each coded symbol. Larger values make
+                the model move away from its uniform start more quickly.
+            max_total: When the total count exceeds this value the counts are
+                halved, so that the model keeps tracking changes in the data.
+        """
+        self._increment = increment
+        self._max_total = max_total
+
+    def encode(self, contexts: List[Any]) -> bytes:
+        """Encode a list of arrays, one per context
+
+        Args:
+            contexts: Integer arrays (or lists), for example the quantized
+                coefficient arrays of a wavelet decomposition
+
+        Returns:
+            The encoded bytes
+        """
+        parts = [_adaptive_header.pack(_adaptive_magic, _adaptive_version, len(contexts))]
+        for values in contexts:
+            parts.append(self._encode_context(np.asarray(values)))
+        return b"".join(parts)
+
+    def decode(self, encoded_data: bytes) -> List[np.ndarray]:
+        """Decode data produced by encode
+
+        Returns:
+            The list of decoded arrays, one per context
+        """
+        encoded_data = memoryview(encoded_data).cast("B")
+        if len(encoded_data) < _adaptive_header.size:
+            raise ValueError("Encoded data is too short")
+        magic, version, num_contexts = _adaptive_header.unpack_from(encoded_data, 0)
+        if magic != _adaptive_magic:
+            raise ValueError("Not adaptive arithmetic coder data")
+        if version != _adaptive_version:
+            raise ValueError(f"Unsupported format version: {version}")
+        offset = _adaptive_header.size
+        ret = []
+        for _ in range(num_contexts):
+            values, offset = self._decode_context(encoded_data, offset)
+            ret.append(values)
+        if offset != len(encoded_data):
+            raise ValueError("Encoded data has trailing bytes")
+        return ret
+
+    def _encode_context(self, values: np.ndarray) -> bytes:
+        dtype = values.dtype if np.issubdtype(values.dtype, np.integer) else np.dtype(np.int16)
+        values = values.ravel().astype(np.int64, copy=False)
+        n = len(values)
+        lo, hi = _get_adaptive_range(values)
+        escape_index = hi - lo + 1
+        rel = values - lo
+        in_range = (rel >= 0) & (rel < escape_index)
+        indices = np.where(in_range, rel, escape_index)
+        escapes = values[~in_range].astype(_escape_dtype_for(dtype))
+        num_lanes = _get_num_lanes(n)
+        f_all = np.zeros(n, dtype=np.uint32)
+        c_all = np.zeros(n, dtype=np.uint32)
+        model = _AdaptiveModel(escape_index + 1, self._increment, self._max_total)
+        for step_start, step_end in _get_adaptive_periods(n, num_lanes):
+            i1 = step_start * num_lanes
+            i2 = min(step_end * num_lanes, n)
+            period_indices = indices[i1:i2]
+            f_all[i1:i2] = model.freq[period_indices]
+            c_all[i1:i2] = model.cum[period_indices]
+            model.update(period_indices)
+        states, words = _rans_encode(f_all, c_all, _adaptive_scale_bits, num_lanes)
+        return b"".join([
+            _context_header.pack(
+                n, num_lanes, len(escapes), len(words), lo, hi, dtype.str.encode().ljust(4)
+            ),
+            states.astype("<u4").tobytes(),
+            escapes.tobytes(),
+            words.astype("<u2").tobytes(),
+        ])
+
+    def _decode_context(self, encoded_data: memoryview, offset: int) -> Tuple[np.ndarray, int]:
+        if len(encoded_data) < offset + _context_header.size:
+            raise ValueError("Encoded data is truncated")
+        n, num_lanes, num_escapes, num_words, lo, hi, dtype_str = _context_header.unpack_from(encoded_data, offset)
+        offset += _context_header.size
+        dtype = np.dtype(dtype_str.decode().strip())
+        escape_dtype = _escape_dtype_for(dtype)
+        size = 4 * num_lanes + escape_dtype.itemsize * num_escapes + 2 * num_words
+        if len(encoded_data) < offset + size:
+            raise ValueError("Encoded data is truncated")
+        states = np.frombuffer(encoded_data, dtype="<u4", count=num_lanes, offset=offset)
+        offset += 4 * num_lanes
+        escapes = np.frombuffer(encoded_data, dtype=escape_dtype, count=num_escapes, offset=offset)
+        offset += escape_dtype.itemsize * num_escapes
+        words = np.frombuffer(encoded_data, dtype="<u2", count=num_words, offset=offset)
+        offset += 2 * num_words
+        escape_index = hi - lo + 1
+        model = _AdaptiveModel(escape_index + 1, self._increment, self._max_total)
+        decoder = _RansDecoder(states, words, n)
+        for step_start, step_end in _get_adaptive_periods(n, num_lanes):
+            decoder.decode_steps(
+                step_start, step_end,
+                model.freq, model.cum, model.slot_to_index, _adaptive_scale_bits
+            )
+            model.update(decoder.indices[step_start * num_lanes:min(step_end * num_lanes, n)])
+        decoder.finish()
+        values = decoder.indices.astype(np.int64) + lo
+        escaped = decoder.indices == escape_index
+        if np.count_nonzero(escaped) != num_escapes:
+            raise ValueError("Encoded data is corrupted")
+        values[escaped] = escapes
+        return values.astype(dtype), offset
+
+
+class _AdaptiveModel:
+    def __init__(self, alphabet_size: int, increment: int, max_total: int):
+        """Adaptive frequency model shared by the encoder and the decoder"""
+        self._counts = np.ones(alphabet_size, dtype=np.int64)
+        self._increment = increment
+        self._max_total = max_total
+        self._update_tables()
+
+    def update(self, indices: np.ndarray):
+        """Add the counts of a period of coded symbols and rebuild the tables"""
+        if len(indices) == 0:
+            return
+        self._counts += np.bincount(indices, minlength=len(self._counts)) * self._increment
+        while int(np.sum(self._counts)) > self._max_total:
+            self._counts = (self._counts + 1) // 2
+        self._update_tables()
+
+    def _update_tables(self):
+        freq = _quantize_frequencies(self._counts, 1 << _adaptive_scale_bits)
+        self.freq = freq.astype(np.uint32)
+        self.cum = np.concatenate([[0], np.cumsum(freq)[:-1]]).astype(np.uint32)
+        self.slot_to_index = np.repeat(np.arange(len(freq), dtype=np.intp), freq)
 
-    def _encode_signal(self, signal: List[int], encoder_tree: NestedDict):
-        """Encode a signal using the encoder tree"""
-        encoded_signal: List[int] = []
-        tree0: NestedDict = encoder_tree
 
-        for i in signal + [-1]:  # Add end marker
-            x = tree0[i]
-            if isinstance(x, dict):
-                tree0 = x
-            else:
-                encoded_signal.append(x)
-                tree0 = encoder_tree
+def _get_adaptive_range(values: np.ndarray) -> Tuple[int, int]:
+    """Choose the range of values that an adaptive context codes directly
 
-        if tree0 != encoder_tree:
-            raise ValueError("Encoding error: Tree not at root")
+    The range covers all the values when it fits in the alphabet, and is
+    otherwise centered on the median; values outside it are escaped.
+    """
+    if len(values) == 0:
+        return 0, 0
+    vmin = int(np.min(values))
+    vmax = int(np.max(values))
+    width = _max_adaptive_alphabet_size - 1  # one symbol is the escape
+    if vmax - vmin + 1 <= width:
+        return vmin, vmax
+    lo = max(vmin, int(np.median(values)) - width // 2)
+    hi = min(vmax, lo + width - 1)
+    return hi - width + 1, hi
 
-        return np.array(encoded_signal, dtype=np.uint16)
 
-    def _decode_signal(self, encoded_signal: List[int], decoder_table: Dict[int, List[int]]):
-        """Decode an encoded signal using the decoder table"""
-        if len(encoded_signal) == 0:
-            raise ValueError("Empty encoded signal")
+def _get_adaptive_periods(num_symbols: int, num_lanes: int) -> List[Tuple[int, int]]:
+    """Split the coding steps into the periods after which the model is updated"""
+    if num_symbols == 0:
+        return []
+    num_steps = -(-num_symbols // num_lanes)
+    periods = []
+    step = 0
+    period_size = _adaptive_first_period
+    while step < num_steps:
+        period_steps = max(1, period_size // num_lanes)
+        periods.append((step, min(step + period_steps, num_steps)))
+        step += period_steps
+        period_size = min(period_size * 2, _adaptive_max_period)
+    return periods
+
+
+def _escape_dtype_for(dtype: np.dtype) -> np.dtype:
+    return np.dtype("<i4" if dtype.itemsize <= 4 else "<i8")
+
+
+_codec_table_cache: "OrderedDict[str, dict]" = OrderedDict()
+
+
+def _get_codec_tables(symbols: np.ndarray, counts: np.ndarray) -> dict:
+    """Get the codec tables for a histogram, building them only once
+
+    The tables are cached by a hash of the histogram contents, so models
+    trained on data with the same histogram share their tables.
+
+    Args:
+        symbols: Sorted array of distinct symbols (int64)
+        counts: Number of occurrences of each symbol (int64)
+
+    Returns:
+        Dictionary of codec tables
+    """
+    h = hashlib.sha1()
+    h.update(symbols.astype("<i8").tobytes())
+    h.update(counts.astype("<i8").tobytes())
+    key = h.hexdigest()
+    if key in _codec_table_cache:
+        _codec_table_cache.move_to_end(key)
+        return _codec_table_cache[key]
+    tables = _create_codec_tables(symbols, counts)
+    tables["hash"] = key
+    _codec_table_cache[key] = tables
+    while len(_codec_table_cache) > _max_codec_table_cache_size:
+        _codec_table_cache.popitem(last=False)
+    return tables
+
+
+def _create_codec_tables(symbols: np.ndarray, counts: np.ndarray) -> dict:
+    """Create the flat lookup tables used by the range coder"""
+    coder_index = np.arange(len(symbols), dtype=np.intp)
+    if len(symbols) > _max_alphabet_size:
+        # keep the most frequent symbols and add an escape symbol for the rest
+        keep = np.zeros(len(symbols), dtype=bool)
+        keep[np.argsort(-counts, kind="stable")[:_max_alphabet_size - 1]] = True
+        escape_index = _max_alphabet_size - 1
+        coder_index[keep] = np.arange(escape_index)
+        coder_index[~keep] = escape_index
+        coder_symbols = np.concatenate([symbols[keep], [0]])
+        coder_counts = np.concatenate([counts[keep], [np.sum(counts[~keep])]])
+    else:
+        escape_index = -1
+        coder_symbols = symbols.copy()
+        coder_counts = counts
+    scale_bits = _default_scale_bits
+    while (1 << scale_bits) < 2 * len(coder_counts):
+        scale_bits += 1
+    freq = _quantize_frequencies(coder_counts, 1 << scale_bits)
+    for a in (symbols, counts, coder_index, coder_symbols):
+        a.flags.writeable = False
+    tables = {
+        "symbols": symbols,
+        "counts": counts,
+        "coder_index": coder_index,
+        "coder_symbols": coder_symbols,
+        "escape_index": escape_index,
+        # escaped values are stored raw, using 32 bits when the alphabet allows
+        "escape_dtype": np.dtype("<i4" if _fits_int32(symbols) else "<i8"),
+        "scale_bits": scale_bits,
+        "freq": freq.astype(np.uint32),
+        "cum": np.concatenate([[0], np.cumsum(freq)[:-1]]).astype(np.uint32),
+        # decoder: slot in [0, 2**scale_bits) -> coder index
+        "slot_to_index": np.repeat(np.arange(len(freq), dtype=np.intp), freq),
+        # encoder: symbol value -> coder index
+        "lookup_offset": int(symbols[0]),
+        "symbol_to_index": None,
+    }
+    lookup_size = int(symbols[-1]) - int(symbols[0]) + 1
+    if lookup_size <= _max_dense_lookup_size:
+        symbol_to_index = np.full(lookup_size, -1, dtype=np.intp)
+        symbol_to_index[symbols - symbols[0]] = coder_index
+        tables["symbol_to_index"] = symbol_to_index
+    return tables
+
+
+def _fits_int32(symbols: np.ndarray) -> bool:
+    info = np.iinfo(np.int32)
+    return info.min <= int(symbols[0]) and int(symbols[-1]) <= info.max
+
+
+def _quantize_frequencies(counts: np.ndarray, total: int) -> np.ndarray:
+    """Scale counts to positive integer frequencies that sum to total
+
+    Args:
+        counts: Positive counts, at most total / 2 of them
+        total: The required sum of the frequencies
+
+    Returns:
+        Array of frequencies (int64)
+    """
+    counts = counts.astype(np.int64)
+    count_sum = int(np.sum(counts))
+    scaled = counts * total
+    freq = np.maximum(scaled // count_sum, 1)
+    diff = total - int(np.sum(freq))
+    if diff > 0:
+        # flooring loses less than one per symbol, so give one back to the
+        # symbols with the largest remainders
+        remainders = scaled - freq * count_sum
+        freq[np.argsort(-remainders, kind="stable")[:diff]] += 1
+    elif diff < 0:
+        # rounding rare symbols up to 1 over-allocated; take the excess back
+        # from the other symbols in proportion to their frequencies
+        reducible = freq - 1
+        take = reducible * -diff // int(np.sum(reducible))
+        freq -= take
+        diff += int(np.sum(take))
+        if diff < 0:
+            freq[np.argsort(-(freq - 1), kind="stable")[:-diff]] -= 1
+    assert int(np.sum(freq)) == total and np.all(freq > 0)
+    return freq
+
+
+def _get_num_lanes(num_symbols: int) -> int:
+    return -(-num_symbols // _default_lane_length)
+
+
+def _rans_encode(f_all: np.ndarray, c_all: np.ndarray, scale_bits: int, num_lanes: int):
+    """Encode symbols with an interleaved rANS coder
+
+    Symbol i is handled by lane i % num_lanes, and all lanes are advanced
+    together, one step of num_lanes consecutive symbols at a time. rANS is
+    last-in-first-out, so the steps are encoded in reverse and the emitted
+    words are reversed at the end so that the decoder can read them forwards.
+
+    Args:
+        f_all: Quantized frequency of each symbol to encode (uint32)
+        c_all: Cumulative quantized frequency of each symbol to encode (uint32)
+        scale_bits: log2 of the sum of the quantized frequencies
+        num_lanes: Number of interleaved coder states
+
+    Returns:
+        The final lane states (uint32) and the emitted words (uint16)
+    """
+    n = len(f_all)
+    x = np.full(num_lanes, _RANS_L, dtype=np.uint32)
+    if n == 0:
+        return x, np.zeros(0, dtype=np.uint16)
+    # a lane must renormalize before encoding a symbol of frequency f when its
+    # state exceeds this threshold (computed in 64 bits since f may be 2**scale_bits)
+    x_thresh_all = ((f_all.astype(np.uint64) << np.uint64(32 - scale_bits)) - 1).astype(np.uint32)
+    num_steps = -(-n // num_lanes)
+    # the emitted words are collected in a (step, lane) grid so that reading
+    # the grid in row-major order gives the order in which the decoder needs them
+    words = np.zeros((num_steps, num_lanes), dtype=np.uint16)
+    emit = np.zeros((num_steps, num_lanes), dtype=bool)
+    word_shift = np.uint32(_RANS_WORD_BITS)
+    for t in range(num_steps - 1, -1, -1):
+        i1 = t * num_lanes
+        i2 = min(i1 + num_lanes, n)
+        k = i2 - i1
+        xs = x[:k]
+        mask = emit[t, :k]
+        np.greater(xs, x_thresh_all[i1:i2], out=mask)
+        words[t, :k] = xs
+        np.right_shift(xs, word_shift, out=xs, where=mask)
+        q, r = np.divmod(xs, f_all[i1:i2])
+        xs[:] = (q << np.uint32(scale_bits)) + r + c_all[i1:i2]
+    return x, words[emit]
+
+
+def _rans_decode(
+    states: np.ndarray,
+    words: np.ndarray,
+    num_symbols: int,
+    freq: np.ndarray,
+    cum: np.ndarray,
+    slot_to_index: np.ndarray,
+    scale_bits: int
+) -> np.ndarray:
+    """Decode symbol indices produced by _rans_encode with a static model"""
+    decoder = _RansDecoder(states, words, num_symbols)
+    decoder.decode_steps(0, decoder.num_steps, freq, cum, slot_to_index, scale_bits)
+    decoder.finish()
+    return decoder.indices
+
+
+class _RansDecoder:
+    def __init__(self, states: np.ndarray, words: np.ndarray, num_symbols: int):
+        """Decoding state for _rans_encode output, advanced a range of steps at a time
+
+        Args:
+            states: Final lane states written by the encoder
+            words: Emitted words, in the order written by the encoder
+            num_symbols: Total number of symbols
+        """
+        num_lanes = len(states)
+        if num_symbols > 0 and num_lanes == 0:
+            raise ValueError("Encoded data has no coder states")
+        self.indices = np.zeros(num_symbols, dtype=np.intp)
+        self.num_lanes = num_lanes
+        self.num_steps = -(-num_symbols // num_lanes) if num_symbols > 0 else 0
+        self._x = states.astype(np.uint32)
+        self._words = words
+        self._pos = 0
 
-        signal: List[int] = []
-        for i in encoded_signal:
-            signal.extend(decoder_table[i])
+    def decode_steps(
+        self,
+        step_start: int,
+        step_end: int,
+        freq: np.ndarray,
+        cum: np.ndarray,
+        slot_to_index: np.ndarray,
+        scale_bits: int
+    ):
+        """Decode the symbols of steps [step_start, step_end) into self.indices"""
+        x = self._x
+        words = self._words
+        indices = self.indices
+        num_symbols = len(indices)
+        num_lanes = self.num_lanes
+        slot_mask = np.uint32((1 << scale_bits) - 1)
+        shift = np.uint32(scale_bits)
+        word_shift = np.uint32(_RANS_WORD_BITS)
+        pos = self._pos
+        for t in range(step_start, step_end):
+            i1 = t * num_lanes
+            i2 = min(i1 + num_lanes, num_symbols)
+            xs = x[:i2 - i1]
+            slot = xs & slot_mask
+            idx = slot_to_index[slot]
+            indices[i1:i2] = idx
+            xs[:] = freq[idx] * (xs >> shift) + slot - cum[idx]
+            mask = xs < _RANS_L
+            m = int(np.count_nonzero(mask))
+            if m > 0:
+                if pos + m > len(words):
+                    raise ValueError("Encoded data is truncated")
+                xs[mask] = (xs[mask] << word_shift) | words[pos:pos + m]
+                pos += m
+        self._pos = pos
 
-        # Remove end marker
-        assert signal[-1] == -1
-        return np.array(signal[:-1]).astype(np.int16)
+    def finish(self):
+        """Check that the encoded data was consumed exactly"""
+        if self._pos != len(self._words) or np.any(self._x != _RANS_L):
+            raise ValueError("Encoded data is corrupted")
@@ -0,0 +1,84 @@
+from typing import Any, Callable
+from collections import OrderedDict
+import hashlib
+import numpy as np
+
+
+# Results of the (signal, filter, transform) stage of the compression
+# scripts, keyed by a hash of the input samples and the parameters, so that
+# requests that only change the NRMSE targets or the lossless method reuse
+# the filtered signal, the coefficients and the noise level. The cache lives
+# in this module, so in pyodide it persists across runs in the same worker.
+default_max_bytes = 128 * 2**20
+
+
+class ByteLRUCache:
+    """
+    Least-recently-used cache bounded by the total size of the numpy arrays
+    in its values (found recursively in tuples, lists and dicts)
+
+    Values larger than max_bytes are returned but not stored. Cached values
+    are shared between callers and must not be modified.
+    """
+
+    def __init__(self, *, max_bytes: int = default_max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.num_hits = 0
+        self.num_misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.num_hits += 1
+            return self._entries[key][0]
+        self.num_misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key: str, value: Any):
+        if key in self._entries:
+            self.total_bytes -= self._entries.pop(key)[1]
+        nbytes = _get_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = (value, nbytes)
+        self.total_bytes += nbytes
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: str):
+        return key in self._entries
+
+
+def get_content_key(*arrays: np.ndarray, **params) -> str:
+    """SHA-1 of the parameters and of the shape, dtype and bytes of the arrays"""
+    h = hashlib.sha1(repr(sorted(params.items())).encode())
+    for a in arrays:
+        a = np.asarray(a)
+        h.update(repr((a.shape, a.dtype.str)).encode())
+        h.update(np.ascontiguousarray(a).data)
+    return h.hexdigest()
+
+
+def _get_nbytes(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_get_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_get_nbytes(v) for v in value.values())
+    return 0
+
+
+coefficient_cache = ByteLRUCache()
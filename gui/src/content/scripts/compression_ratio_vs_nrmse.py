@@ -1,36 +1,23 @@
-from typing import List, Tuple, Callable, Literal
+from typing import Any, Dict, List, Optional, Tuple, Callable, Literal
 import io
+import os
+import sys
 import requests
-from scipy.special import erf
 import numpy as np
 import matplotlib.pyplot as plt
 
-
-def p_function_gaussian(i, q, sigma):
-    return 0.5 * (
-        erf((i + 0.5) * q / (2**0.5 * sigma)) - erf((i - 0.5) * q / (2**0.5 * sigma))
-    )
-
-
-def entropy_per_sample_gaussian(q, sigma):
-    v = round(sigma / q * 20)
-    return -sum(
-        p_function_gaussian(i, q, sigma) * np.log2(p_function_gaussian(i, q, sigma))
-        for i in range(-v, v + 1)
-        if p_function_gaussian(i, q, sigma) > 0
-    )
-
-
-def theoretical_compression_ratio_gaussian(q, sigma):
-    return 16 / entropy_per_sample_gaussian(q, sigma)
-
-
-def nrmse_gaussian(q, sigma):
-    x = np.arange(-5 * sigma, 5 * sigma, 0.01)
-    p = np.exp(-(x**2) / (2 * sigma**2)) / (np.sqrt(2 * np.pi) * sigma)
-    p = p / np.sum(p)
-    xhat = np.round(x / q) * q
-    return np.sqrt(np.sum((x - xhat) ** 2 * p) / sigma**2)
+try:
+    from .filters import bandpass_filter
+    from .lossless import get_lossless_backend
+    from .noise_level import estimate_noise_level
+    from .quantization import CoefficientQuantizer, quantize_coeffs
+    from .rate_distortion import compute_theoretical_bits_per_sample
+except ImportError:
+    from filters import bandpass_filter
+    from lossless import get_lossless_backend
+    from noise_level import estimate_noise_level
+    from quantization import CoefficientQuantizer, quantize_coeffs
+    from rate_distortion import compute_theoretical_bits_per_sample
 
 
 def simulated_nrmse(q, sigma):
@@ -41,21 +28,7 @@ def simulated_nrmse(q, sigma):
 
 
 def compress_buffer(buf, lossless_method: Literal["zlib", "zstandard", "lzma"]):
-    if lossless_method == "zlib":
-        import zlib
-
-        return zlib.compress(buf, level=9)
-    elif lossless_method == "zstandard":
-        import zstandard
-
-        cctx = zstandard.ZstdCompressor(level=22)
-        return cctx.compress(buf)
-    elif lossless_method == "lzma":
-        import lzma
-
-        return lzma.compress(buf, preset=9)
-    else:
-        raise ValueError("Invalid lossless method")
+    return get_lossless_backend(lossless_method).compress(buf)
 
 
 def get_compression_ratio(
@@ -67,45 +40,6 @@ def get_compression_ratio(
     return len(signal) * 2 / len(compressed)
 
 
-def lowpass_filter(array, *, sampling_frequency, highcut) -> np.ndarray:
-    from scipy.signal import butter, lfilter
-
-    nyquist = 0.5 * sampling_frequency
-    high = highcut / nyquist
-    b, a = butter(5, high, btype="low")
-    return lfilter(b, a, array, axis=0)  # type: ignore
-
-
-def highpass_filter(array, *, sampling_frequency, lowcut) -> np.ndarray:
-    from scipy.signal import butter, lfilter
-
-    nyquist = 0.5 * sampling_frequency
-    low = lowcut / nyquist
-    b, a = butter(5, low, btype="high")
-    return lfilter(b, a, array, axis=0)  # type: ignore
-
-
-def bandpass_filter(array, *, sampling_frequency, lowcut, highcut) -> np.ndarray:
-    from scipy.signal import butter, lfilter
-
-    nyquist = 0.5 * sampling_frequency
-    low = lowcut / nyquist
-    high = highcut / nyquist
-    b, a = butter(5, [low, high], btype="band")
-    return lfilter(b, a, array, axis=0)  # type: ignore
-
-
-def estimate_noise_level(array: np.ndarray, *, sampling_frequency: float) -> float:
-    array_filtered = highpass_filter(
-        array, sampling_frequency=sampling_frequency, lowcut=300
-    )
-    MAD = float(
-        np.median(np.abs(array_filtered.ravel() - np.median(array_filtered.ravel())))
-        / 0.6745
-    )
-    return MAD
-
-
 def compute_nrmse(*, signal, q, noise_level):
     xhat = np.round(signal / q) * q
     return np.sqrt(np.sum((signal - xhat) ** 2) / len(signal) / noise_level**2)
@@ -161,6 +95,113 @@ def _monotonic_binary_search(
     return (upper_bound + lower_bound) / 2
 
 
+def _monotonic_multi_target_search(
+    func: Callable[[float], float],
+    target_values: List[float],
+    max_iterations: int,
+    tolerance: float,
+) -> List[float]:
+    """
+    Solves _monotonic_binary_search (ascending case) for several target
+    values in one pass, sharing a memoized table of evaluations of func
+
+    The upper bound is found once, for the largest target, and the targets
+    are then solved in increasing order, each starting from the tightest
+    bracket in the table (which includes its neighbors' evaluations).
+    """
+    table: Dict[float, float] = {}
+
+    def evaluate(x):
+        if x not in table:
+            table[x] = func(x)
+        return table[x]
+
+    if len(target_values) == 0:
+        return []
+    # first find an upper bound for the largest target
+    max_target_value = max(target_values)
+    upper_bound = 1
+    num_iterations = 0
+    last_val = None
+    while True:
+        new_val = evaluate(upper_bound)
+        if new_val > max_target_value:
+            break
+        upper_bound *= 2
+        num_iterations += 1
+        if num_iterations > max_iterations:
+            break
+        if last_val is not None:
+            if new_val < last_val:
+                # fails to be monotonically increasing
+                break
+        last_val = new_val
+    # then do a binary search for each target
+    ret: List[float] = [0] * len(target_values)
+    for i in np.argsort(target_values):
+        target_value = target_values[i]
+        xs = sorted(table.keys())
+        upper = next((x for x in xs if table[x] >= target_value), None)
+        if upper is None:
+            ret[i] = xs[-1]
+            continue
+        lower = max((x for x in xs if x < upper and table[x] < target_value), default=0)
+        num_iterations = 0
+        while upper - lower > tolerance:
+            candidate = (upper + lower) / 2
+            if evaluate(candidate) < target_value:
+                lower = candidate
+            else:
+                upper = candidate
+            num_iterations += 1
+            if num_iterations > max_iterations:
+                break
+        ret[i] = (upper + lower) / 2
+    return ret
+
+
+def _monotonic_binary_search_multichannel(
+    func: Callable[[np.ndarray], np.ndarray],
+    target_value: float,
+    num_channels: int,
+    max_iterations: int,
+    tolerance: float,
+) -> np.ndarray:
+    """
+    Vectorized version of _monotonic_binary_search (ascending case) that
+    searches one value per channel, evaluating all channels in each call
+    """
+    num_iterations = 0
+    # first find an upper bound for each channel
+    upper_bound = np.ones(num_channels)
+    done = np.zeros(num_channels, dtype=bool)
+    last_val = None
+    while True:
+        new_val = func(upper_bound)
+        done |= new_val > target_value
+        if last_val is not None:
+            # fails to be monotonically increasing
+            done |= new_val < last_val
+        if np.all(done):
+            break
+        upper_bound = np.where(done, upper_bound, upper_bound * 2)
+        num_iterations += 1
+        if num_iterations > max_iterations:
+            return upper_bound
+        last_val = new_val
+    # then do a binary search on all channels at once
+    lower_bound = np.zeros(num_channels)
+    while np.max(upper_bound - lower_bound) > tolerance:
+        candidate = (upper_bound + lower_bound) / 2
+        below = func(candidate) < target_value
+        lower_bound = np.where(below, candidate, lower_bound)
+        upper_bound = np.where(below, upper_bound, candidate)
+        num_iterations += 1
+        if num_iterations > max_iterations:
+            break
+    return (upper_bound + lower_bound) / 2
+
+
 def show_compression_ratio_vs_nrmse(
     *, nrmses: List[np.ndarray], plot_series: List[Tuple], title: str
 ):
@@ -187,13 +228,19 @@ def load_real_1(
 
 
 def get_signal(
-    signal_type: Literal["gaussian", "real"], *, use_filter: bool = False
+    signal_type: Literal["gaussian", "real"],
+    *,
+    use_filter: bool = False,
+    seed: Optional[int] = None,
 ) -> np.ndarray:
     """Helper function to get signal and noise level based on type"""
     if signal_type == "gaussian":
         N = 100000
         sigma = 1
-        signal = np.random.normal(0, sigma, N)
+        if seed is None:
+            signal = np.random.normal(0, sigma, N)
+        else:
+            signal = np.random.default_rng(seed).normal(0, sigma, N)
     else:  # real
         signal = load_real_1(num_samples=100000, num_channels=1, start_channel=101)
         signal = (signal.ravel() - np.median(signal.ravel())).astype(np.int16)
@@ -206,103 +253,187 @@ def get_signal(
     return signal
 
 
-def quantize(data: np.ndarray) -> np.ndarray:
-    data_rounded = np.round(data)
-    if (
-        np.min(data_rounded) < np.iinfo(np.int16).min
-        or np.max(data_rounded) > np.iinfo(np.int16).max
-    ):
-        print("Warning: data is out of range of int16. Using int32 instead.")
-        return np.round(data).astype(np.int32)
-    return np.round(data).astype(np.int16)
-
-
 def get_compression_ratio_qfc_or_qwc(
     *,
     signal: np.ndarray,
     target_nrmse: float,
     lossless_method: Literal["zlib", "zstandard", "lzma"],
     wavelet_name: Literal["fourier", "time-domain", "db4"],
-) -> Tuple[float, float, float]:
+) -> Tuple[Any, Any, Any]:
+    """Compression ratio of QFC/QWC/QTC at a target NRMSE
+
+    A 2-D (samples x channels) signal is processed channel-batched: the
+    transforms run along axis 0, each channel has its own noise level and
+    quantization step (found together in one vectorized search), and the
+    returned NRMSEs and ratios are per-channel arrays.
+    """
+    return get_compression_ratios_qfc_or_qwc(
+        signal=signal,
+        target_nrmses=[target_nrmse],
+        lossless_method=lossless_method,
+        wavelet_name=wavelet_name,
+    )[0]
+
+
+def get_compression_ratios_qfc_or_qwc(
+    *,
+    signal: np.ndarray,
+    target_nrmses: List[float],
+    lossless_method: Literal["zlib", "zstandard", "lzma"],
+    wavelet_name: Literal["fourier", "time-domain", "db4"],
+) -> List[Tuple[Any, Any, Any]]:
+    """Same as get_compression_ratio_qfc_or_qwc for several target NRMSEs
+
+    The transform and noise level are computed once, and for a 1-D signal
+    the quantization steps of all targets are found in one pass of
+    _monotonic_multi_target_search.
+    """
+    coeffs, reconstruct, estimated_noise_level = _prepare_transform(
+        signal=signal, wavelet_name=wavelet_name
+    )
+    quantization_steps = _find_quantization_steps(
+        signal=signal,
+        coeffs=coeffs,
+        reconstruct=reconstruct,
+        estimated_noise_level=estimated_noise_level,
+        target_nrmses=target_nrmses,
+    )
+
+    return [
+        _get_compression_ratio_for_quantization_step(
+            signal=signal,
+            coeffs=coeffs,
+            quantization_step=quantization_step,
+            reconstruct=reconstruct,
+            estimated_noise_level=estimated_noise_level,
+            lossless_method=lossless_method,
+        )
+        for quantization_step in quantization_steps
+    ]
+
+
+def _prepare_transform(
+    *,
+    signal: np.ndarray,
+    wavelet_name: Literal["fourier", "time-domain", "db4"],
+) -> Tuple[list, Callable, Any]:
+    """Coefficients, reconstruction function and noise level of a signal"""
     import pywt
 
     wavelet_extension_mode = "sym"
+    num_samples = signal.shape[0]
     if wavelet_name == "fourier":
-        signal_fft = np.fft.rfft(signal.astype(float))
+        signal_fft = np.fft.rfft(signal.astype(float), axis=0)
         coeffs = [np.real(signal_fft), np.imag(signal_fft)]
     elif wavelet_name == "time-domain":
         coeffs = [signal]
     else:
-        coeffs = pywt.wavedec(signal, wavelet_name, mode=wavelet_extension_mode)
+        coeffs = pywt.wavedec(signal, wavelet_name, mode=wavelet_extension_mode, axis=0)
 
     estimated_noise_level = estimate_noise_level(signal, sampling_frequency=30000)
 
-    def get_nrmse_for_quantization_step(*, quant_step):
-        coeffs_quantized = [quantize(c / quant_step) for c in coeffs]
+    def reconstruct(coeffs_quantized, quant_step):
         if wavelet_name == "fourier":
-            reconstructed_signal = (
-                np.fft.irfft(coeffs_quantized[0] + 1j * coeffs_quantized[1])
-                * quant_step
+            reconstructed_signal = np.fft.irfft(
+                coeffs_quantized[0] + 1j * coeffs_quantized[1], n=num_samples, axis=0
             )
         elif wavelet_name == "time-domain":
-            reconstructed_signal = coeffs_quantized[0] * quant_step
+            reconstructed_signal = coeffs_quantized[0]
         else:
-            reconstructed_signal = (
-                pywt.waverec(
-                    coeffs_quantized, wavelet_name, mode=wavelet_extension_mode
-                )
-                * quant_step
-            )
+            reconstructed_signal = pywt.waverec(
+                coeffs_quantized, wavelet_name, mode=wavelet_extension_mode, axis=0
+            )[:num_samples]
+        return reconstructed_signal * quant_step
+
+    return coeffs, reconstruct, estimated_noise_level
+
+
+def _find_quantization_steps(
+    *,
+    signal: np.ndarray,
+    coeffs: list,
+    reconstruct: Callable,
+    estimated_noise_level,
+    target_nrmses: List[float],
+) -> list:
+    num_samples = signal.shape[0]
+    quantizer = CoefficientQuantizer(coeffs)
 
+    def get_nrmse_for_quantization_step(*, quant_step):
+        coeffs_quantized = quantizer.quantize(quant_step)
+        reconstructed_signal = reconstruct(coeffs_quantized, quant_step)
         nrmse = np.sqrt(
-            np.sum((signal - reconstructed_signal) ** 2)
-            / len(signal)
+            np.sum((signal - reconstructed_signal) ** 2, axis=0)
+            / num_samples
             / estimated_noise_level**2
         )
         return nrmse
 
-    quantization_step = _monotonic_binary_search(
-        lambda x: get_nrmse_for_quantization_step(quant_step=x),
-        target_value=target_nrmse,
-        max_iterations=100,
-        tolerance=1e-3,
-        ascending=True,
-    )
-
-    coeffs_quantized = [quantize(c / quantization_step) for c in coeffs]
-    if wavelet_name == "fourier":
-        reconstructed_signal = (
-            np.fft.irfft(coeffs_quantized[0] + 1j * coeffs_quantized[1])
-            * quantization_step
-        )
-    elif wavelet_name == "time-domain":
-        reconstructed_signal = coeffs_quantized[0] * quantization_step
+    if signal.ndim == 2:
+        quantization_steps = [
+            _monotonic_binary_search_multichannel(
+                lambda x: get_nrmse_for_quantization_step(quant_step=x),
+                target_value=target_nrmse,
+                num_channels=signal.shape[1],
+                max_iterations=100,
+                tolerance=1e-3,
+            )
+            for target_nrmse in target_nrmses
+        ]
     else:
-        reconstructed_signal = (
-            pywt.waverec(coeffs_quantized, wavelet_name, mode=wavelet_extension_mode)
-            * quantization_step
+        quantization_steps = _monotonic_multi_target_search(
+            lambda x: get_nrmse_for_quantization_step(quant_step=x),
+            target_values=list(target_nrmses),
+            max_iterations=100,
+            tolerance=1e-3,
         )
 
+    return quantization_steps
+
+
+def _get_compression_ratio_for_quantization_step(
+    *,
+    signal: np.ndarray,
+    coeffs: list,
+    quantization_step,
+    reconstruct: Callable,
+    estimated_noise_level,
+    lossless_method: Literal["zlib", "zstandard", "lzma"],
+) -> Tuple[Any, Any, Any]:
+    num_samples = signal.shape[0]
+    coeffs_quantized = quantize_coeffs(coeffs, quantization_step)
+    reconstructed_signal = reconstruct(coeffs_quantized, quantization_step)
+
     nrmse = np.sqrt(
-        np.sum((signal - reconstructed_signal) ** 2)
-        / len(signal)
+        np.sum((signal - reconstructed_signal) ** 2, axis=0)
+        / num_samples
         / estimated_noise_level**2
     )
+    if signal.ndim == 2:
+        compression_ratios = []
+        for ch in range(signal.shape[1]):
+            channel_coeffs_quantized = [c[:, ch] for c in coeffs_quantized]
+            compressed_size = len(
+                compress_buffer(np.concatenate(channel_coeffs_quantized), lossless_method)
+            )
+            compression_ratios.append(num_samples * 2 / compressed_size)
+        theoretical_bits_per_sample = compute_theoretical_bits_per_sample(
+            coeffs_quantized, per_channel=True
+        )
+        return (
+            nrmse,
+            np.array(compression_ratios),
+            16 / theoretical_bits_per_sample,
+        )
     compressed_size = len(
-        compress_buffer(np.concatenate(coeffs_quantized).tobytes(), lossless_method)
+        compress_buffer(np.concatenate(coeffs_quantized), lossless_method)
     )
-    compression_ratio = len(signal) * 2 / compressed_size
+    compression_ratio = num_samples * 2 / compressed_size
     theoretical_bits_per_sample = compute_theoretical_bits_per_sample(coeffs_quantized)
     theoretical_compression_ratio = float(16 / theoretical_bits_per_sample)
     return nrmse, compression_ratio, theoretical_compression_ratio
 
 
-def compute_theoretical_bits_per_sample(coeffs_quantized):
-    _, val_counts = np.unique(np.concatenate(coeffs_quantized), return_counts=True)
-    val_probs = val_counts / len(np.concatenate(coeffs_quantized))
-    return -np.sum(val_probs * np.log2(val_probs))
-
-
 def get_compression_results(
     signal: np.ndarray,
     method: Literal["qfc", "qwc", "qtc"],
@@ -314,15 +445,14 @@ def get_compression_results(
     compression_ratios = []
     theoretical_compression_ratios = []
     wavelet_name = {"qfc": "fourier", "qwc": "db4", "qtc": "time-domain"}[method]
-    for target_nrmse in target_nrmses:
-        nrmse, compression_ratio, theoretical_compression_ratio = (
-            get_compression_ratio_qfc_or_qwc(
-                signal=signal,
-                target_nrmse=target_nrmse,
-                lossless_method=lossless_method,
-                wavelet_name=wavelet_name,  # type: ignore
-            )
+    for nrmse, compression_ratio, theoretical_compression_ratio in (
+        get_compression_ratios_qfc_or_qwc(
+            signal=signal,
+            target_nrmses=list(target_nrmses),
+            lossless_method=lossless_method,
+            wavelet_name=wavelet_name,  # type: ignore
         )
+    ):
         nrmses.append(nrmse)
         compression_ratios.append(compression_ratio)
         theoretical_compression_ratios.append(theoretical_compression_ratio)
@@ -330,22 +460,206 @@ def get_compression_results(
     return nrmses, compression_ratios, theoretical_compression_ratios
 
 
+_wavelet_names_by_method: Dict[str, Literal["fourier", "time-domain", "db4"]] = {
+    "qfc": "fourier",
+    "qwc": "db4",
+    "qtc": "time-domain",
+}
+
+# State of a sweep worker: the shared input signal and the transforms it has
+# already computed, keyed by (method, channel)
+_sweep_state: Dict[str, Any] = {}
+
+
+def _init_sweep_worker(shm_name: str, shape: Tuple[int, ...], dtype: str):
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _sweep_state["shm"] = shm
+    _sweep_state["signal"] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _sweep_state["transforms"] = {}
+
+
+def _get_sweep_channel_transform(method: str, channel: int):
+    transforms = _sweep_state["transforms"]
+    if (method, channel) not in transforms:
+        signal = _sweep_state["signal"]
+        channel_signal = signal if signal.ndim == 1 else signal[:, channel]
+        transforms[(method, channel)] = (channel_signal,) + _prepare_transform(
+            signal=channel_signal, wavelet_name=_wavelet_names_by_method[method]
+        )
+    return transforms[(method, channel)]
+
+
+def _run_sweep_search_job(job: Tuple[str, int, List[float]]) -> list:
+    method, channel, target_nrmses = job
+    channel_signal, coeffs, reconstruct, estimated_noise_level = (
+        _get_sweep_channel_transform(method, channel)
+    )
+    return _find_quantization_steps(
+        signal=channel_signal,
+        coeffs=coeffs,
+        reconstruct=reconstruct,
+        estimated_noise_level=estimated_noise_level,
+        target_nrmses=target_nrmses,
+    )
+
+
+def _run_sweep_compression_job(job: Tuple[str, int, float, str]) -> Tuple:
+    method, channel, quantization_step, lossless_method = job
+    channel_signal, coeffs, reconstruct, estimated_noise_level = (
+        _get_sweep_channel_transform(method, channel)
+    )
+    return _get_compression_ratio_for_quantization_step(
+        signal=channel_signal,
+        coeffs=coeffs,
+        quantization_step=quantization_step,
+        reconstruct=reconstruct,
+        estimated_noise_level=estimated_noise_level,
+        lossless_method=lossless_method,  # type: ignore
+    )
+
+
+def run_compression_sweep(
+    signal: np.ndarray,
+    *,
+    methods: List[Literal["qfc", "qwc", "qtc"]] = ["qtc", "qfc", "qwc"],
+    target_nrmses: Optional[List[float]] = None,
+    lossless_methods: List[Literal["zlib", "zstandard", "lzma"]] = ["zstandard"],
+    num_workers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Compression results for every (method, target NRMSE, lossless method,
+    channel) combination, computed on a process pool
+
+    The sweep runs in two phases. First each (method, channel) pair finds the
+    quantization steps of all target NRMSEs in one multi-target search, then
+    each (method, target, lossless method, channel) job quantizes and
+    compresses at its step. The signal (1-D, or samples x channels) is placed
+    in shared memory once and the workers attach to it, so it is never
+    pickled per task.
+
+    Returns a list of rows (dicts with keys method, lossless_method, channel,
+    target_nrmse, quantization_step, nrmse, compression_ratio and
+    theoretical_compression_ratio) in job order, so the output does not
+    depend on num_workers or on the order in which the jobs finish.
+    num_workers defaults to the number of CPUs; with num_workers=1, or where
+    subprocesses are not available (pyodide), the jobs run in this process.
+    """
+    if target_nrmses is None:
+        target_nrmses = list(np.arange(0.05, 0.95, 0.05))
+    signal = np.ascontiguousarray(signal)
+    channels = [0] if signal.ndim == 1 else list(range(signal.shape[1]))
+    search_jobs = [
+        (method, channel, list(target_nrmses))
+        for method in methods
+        for channel in channels
+    ]
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = min(num_workers, len(search_jobs) * len(lossless_methods))
+
+    if num_workers <= 1 or sys.platform == "emscripten":
+        _sweep_state["signal"] = signal
+        _sweep_state["transforms"] = {}
+        try:
+            quantization_steps = [_run_sweep_search_job(job) for job in search_jobs]
+            compression_jobs = _get_sweep_compression_jobs(
+                search_jobs, quantization_steps, lossless_methods
+            )
+            results = [_run_sweep_compression_job(job) for job in compression_jobs]
+        finally:
+            _sweep_state.clear()
+    else:
+        from multiprocessing import Pool, shared_memory
+
+        shm = shared_memory.SharedMemory(create=True, size=max(signal.nbytes, 1))
+        try:
+            np.ndarray(signal.shape, dtype=signal.dtype, buffer=shm.buf)[...] = signal
+            with Pool(
+                num_workers,
+                initializer=_init_sweep_worker,
+                initargs=(shm.name, signal.shape, signal.dtype.str),
+            ) as pool:
+                quantization_steps = pool.map(
+                    _run_sweep_search_job, search_jobs, chunksize=1
+                )
+                compression_jobs = _get_sweep_compression_jobs(
+                    search_jobs, quantization_steps, lossless_methods
+                )
+                results = pool.map(
+                    _run_sweep_compression_job, compression_jobs, chunksize=1
+                )
+        finally:
+            shm.close()
+            shm.unlink()
+
+    rows = []
+    for (method, channel, quantization_step, lossless_method), target_nrmse, (
+        nrmse,
+        compression_ratio,
+        theoretical_compression_ratio,
+    ) in zip(
+        compression_jobs,
+        _get_sweep_target_nrmses(search_jobs, lossless_methods),
+        results,
+    ):
+        rows.append(
+            {
+                "method": method,
+                "lossless_method": lossless_method,
+                "channel": channel,
+                "target_nrmse": float(target_nrmse),
+                "quantization_step": float(quantization_step),
+                "nrmse": float(nrmse),
+                "compression_ratio": float(compression_ratio),
+                "theoretical_compression_ratio": float(theoretical_compression_ratio),
+            }
+        )
+    return rows
+
+
+def _get_sweep_compression_jobs(
+    search_jobs: list, quantization_steps: list, lossless_methods: list
+) -> List[Tuple[str, int, float, str]]:
+    return [
+        (method, channel, quantization_step, lossless_method)
+        for (method, channel, _), steps in zip(search_jobs, quantization_steps)
+        for lossless_method in lossless_methods
+        for quantization_step in steps
+    ]
+
+
+def _get_sweep_target_nrmses(search_jobs: list, lossless_methods: list) -> list:
+    return [
+        target_nrmse
+        for (_, _, target_nrmses) in search_jobs
+        for _ in lossless_methods
+        for target_nrmse in target_nrmses
+    ]
+
+
 def show_compression_method_comparison(
     signal_type: Literal["gaussian", "real"], use_filter: bool = False,
-    show_theoretical_for_reference: bool = False
+    show_theoretical_for_reference: bool = False,
+    num_workers: Optional[int] = None,
+    seed: Optional[int] = None,
 ):
     """Unified function to show compression method comparison for different signal types and filtering"""
-    signal = get_signal(signal_type, use_filter=use_filter)
+    signal = get_signal(signal_type, use_filter=use_filter, seed=seed)
 
     # Get results for each method
     methods: List[Literal["qfc", "qwc", "qtc"]] = ["qtc", "qfc", "qwc"]
     all_nrmses = []
     plot_series = []
 
+    rows = run_compression_sweep(signal, methods=methods, num_workers=num_workers)
     for method in methods:
-        nrmses, compression_ratios, theoretical_compression_ratios = (
-            get_compression_results(signal, method)
-        )
+        method_rows = [row for row in rows if row["method"] == method]
+        nrmses = [row["nrmse"] for row in method_rows]
+        compression_ratios = [row["compression_ratio"] for row in method_rows]
+        theoretical_compression_ratios = [
+            row["theoretical_compression_ratio"] for row in method_rows
+        ]
 
         if show_theoretical_for_reference and method == "qtc":
             all_nrmses.append(nrmses)
@@ -0,0 +1,137 @@
+from typing import Optional
+from functools import lru_cache
+import numpy as np
+
+
+# Butterworth filters in second-order-sections form, shared by the
+# compression scripts. All filters run along the first axis, so a
+# (samples x channels) block is filtered channel-wise in one call.
+
+default_filter_order = 5
+
+
+@lru_cache(maxsize=64)
+def get_butter_sos(
+    sampling_frequency: float,
+    lowcut: Optional[float],
+    highcut: Optional[float],
+    order: int = default_filter_order,
+) -> Optional[np.ndarray]:
+    """
+    Cached Butterworth design: band-pass when both cutoffs are given,
+    high-pass for lowcut only, low-pass for highcut only, None for neither
+
+    The returned array is shared between callers and must not be modified.
+    """
+    from scipy.signal import butter
+
+    nyquist = 0.5 * sampling_frequency
+    if lowcut is not None and highcut is not None:
+        sos = butter(order, [lowcut / nyquist, highcut / nyquist], btype="band", output="sos")
+    elif lowcut is not None:
+        sos = butter(order, lowcut / nyquist, btype="high", output="sos")
+    elif highcut is not None:
+        sos = butter(order, highcut / nyquist, btype="low", output="sos")
+    else:
+        return None
+    return sos
+
+
+def lowpass_filter(
+    array, *, sampling_frequency, highcut, order=default_filter_order, zero_phase=False
+) -> np.ndarray:
+    return _apply_sos(get_butter_sos(sampling_frequency, None, highcut, order), array, zero_phase)
+
+
+def highpass_filter(
+    array, *, sampling_frequency, lowcut, order=default_filter_order, zero_phase=False
+) -> np.ndarray:
+    return _apply_sos(get_butter_sos(sampling_frequency, lowcut, None, order), array, zero_phase)
+
+
+def bandpass_filter(
+    array, *, sampling_frequency, lowcut, highcut, order=default_filter_order, zero_phase=False
+) -> np.ndarray:
+    return _apply_sos(get_butter_sos(sampling_frequency, lowcut, highcut, order), array, zero_phase)
+
+
+def _apply_sos(sos: Optional[np.ndarray], array, zero_phase: bool) -> np.ndarray:
+    from scipy.signal import sosfilt, sosfiltfilt
+
+    if sos is None:
+        return np.asarray(array, dtype=float)
+    if zero_phase:
+        return sosfiltfilt(sos, array, axis=0)
+    return sosfilt(sos, array, axis=0)
+
+
+class StreamingFilter:
+    """
+    A Butterworth filter applied to consecutive blocks of a stream
+
+    The causal filter carries its sosfilt state from one block to the next,
+    so filtering a stream block by block gives the same result as filtering
+    it in one call. Blocks may be 1-D or (samples x channels).
+
+    With zero_phase=True the blocks are also filtered backwards, as in
+    sosfiltfilt. The backward pass needs samples from the future, so output
+    is held back by overlap samples: process returns the samples that are
+    final and flush returns the rest at the end of the stream. The backward
+    pass starts from zero state overlap samples ahead of each output sample,
+    so a longer overlap gives a closer match to sosfiltfilt (the default
+    covers ten periods of the lowest cutoff).
+    """
+
+    def __init__(
+        self,
+        *,
+        sampling_frequency: float,
+        lowcut: Optional[float] = None,
+        highcut: Optional[float] = None,
+        order: int = default_filter_order,
+        zero_phase: bool = False,
+        overlap: Optional[int] = None,
+    ):
+        self.sos = get_butter_sos(sampling_frequency, lowcut, highcut, order)
+        self.zero_phase = zero_phase
+        if overlap is None:
+            lowest_cutoff = min(c for c in (lowcut, highcut, sampling_frequency / 2) if c is not None)
+            overlap = int(np.ceil(10 * sampling_frequency / lowest_cutoff))
+        self.overlap = overlap
+        self._zi: Optional[np.ndarray] = None
+        self._pending: Optional[np.ndarray] = None
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Filter the next block of the stream"""
+        from scipy.signal import sosfilt
+
+        block = np.asarray(block, dtype=float)
+        if self.sos is None:
+            return block
+        if self._zi is None:
+            self._zi = np.zeros((self.sos.shape[0], 2) + block.shape[1:])
+        filtered, self._zi = sosfilt(self.sos, block, axis=0, zi=self._zi)
+        if not self.zero_phase:
+            return filtered
+        if self._pending is not None:
+            filtered = np.concatenate([self._pending, filtered], axis=0)
+        if filtered.shape[0] <= self.overlap:
+            self._pending = filtered
+            return filtered[:0]
+        self._pending = filtered[filtered.shape[0] - self.overlap:]
+        backward = sosfilt(self.sos, filtered[::-1], axis=0)[::-1]
+        return backward[:filtered.shape[0] - self.overlap]
+
+    def flush(self) -> np.ndarray:
+        """The samples held back in zero-phase mode (empty otherwise)"""
+        from scipy.signal import sosfilt
+
+        pending = self._pending
+        self._pending = None
+        if pending is None or pending.shape[0] == 0:
+            return np.zeros((0,) + (self._zi.shape[2:] if self._zi is not None else ()))
+        return sosfilt(self.sos, pending[::-1], axis=0)[::-1]
+
+    def reset(self):
+        self._zi = None
+        self._pending = None
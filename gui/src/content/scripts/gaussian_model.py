@@ -0,0 +1,118 @@
+from functools import lru_cache
+from typing import Tuple
+import numpy as np
+from scipy.special import erf, erfc
+
+
+# Theoretical entropy and NRMSE of rounding a Gaussian signal (zero mean,
+# standard deviation sigma) to multiples of a quantization step q. Both
+# depend only on q / sigma. All functions take scalars or arrays of q and
+# evaluate every (q, bin) pair at once on a 2-D grid.
+
+# Bins further than this many sigmas from zero carry negligible probability
+_max_sigmas = 10
+
+# Largest number of (q, bin) pairs evaluated at once
+_max_grid_size = 1 << 22
+
+# Grid of q / sigma on which NRMSE -> q is inverted by interpolation. Below
+# the grid the high-rate approximation NRMSE = q / (sigma sqrt(12)) is used.
+_inversion_grid = np.geomspace(1e-2, 1e2, 2001)
+
+
+def p_function_gaussian(i, q, sigma):
+    """Probability that a sample rounds to i * q (broadcasts over i and q)"""
+    i = np.asarray(i, dtype=float)
+    r = np.asarray(q, dtype=float) / (2**0.5 * sigma)
+    # with erfc on the positive side, the small probabilities of the far bins
+    # are not lost to cancellation near erf = 1
+    a = (np.abs(i) - 0.5) * r
+    b = (np.abs(i) + 0.5) * r
+    return np.where(i == 0, erf(b), 0.5 * (erfc(a) - erfc(b)))
+
+
+def entropy_per_sample_gaussian(q, sigma):
+    """Entropy in bits per sample of the quantized signal"""
+    return _evaluate(q, sigma, _entropy_terms)
+
+
+def theoretical_compression_ratio_gaussian(q, sigma):
+    return 16 / entropy_per_sample_gaussian(q, sigma)
+
+
+def nrmse_gaussian(q, sigma):
+    """Expected NRMSE (RMS error / sigma) of the quantized signal"""
+    nrmse = np.sqrt(_evaluate(q, sigma, _sq_err_terms))
+    return float(nrmse) if nrmse.ndim == 0 else nrmse
+
+
+def quant_step_for_nrmse_gaussian(nrmse, sigma):
+    """
+    The quantization step that gives the target NRMSE (inverse of
+    nrmse_gaussian), interpolated on a memoized table
+
+    The NRMSE increases with q towards 1 (all samples round to zero), so
+    targets of 1 or more have no finite solution and give inf.
+    """
+    log_r, nrmses = _get_inversion_table()
+    nrmse = np.asarray(nrmse, dtype=float)
+    q = np.exp(np.interp(nrmse, nrmses, log_r)) * sigma
+    q = np.where(nrmse < nrmses[0], nrmse * np.sqrt(12) * sigma, q)
+    q = np.where(nrmse >= nrmses[-1], np.inf, q)
+    return float(q) if q.ndim == 0 else q
+
+
+@lru_cache(maxsize=1)
+def _get_inversion_table() -> Tuple[np.ndarray, np.ndarray]:
+    nrmses = nrmse_gaussian(_inversion_grid, 1)
+    # drop the flat tail where the NRMSE has converged to 1
+    increasing = np.concatenate([[True], np.diff(nrmses) > 0])
+    n = len(increasing) if np.all(increasing) else int(np.argmin(increasing))
+    return np.log(_inversion_grid[:n]), nrmses[:n]
+
+
+def _evaluate(q, sigma, terms):
+    # sums terms(r, j) over the bins j >= 0 for each r = q / sigma, where
+    # terms accounts for the mirrored bin -j
+    r = np.asarray(q, dtype=float) / sigma
+    flat_r = np.atleast_1d(r).ravel()
+    ret = np.zeros(flat_r.shape)
+    # chunks of q within a factor of 2, so that the number of bins, which is
+    # set by the smallest q of each chunk, fits all of them
+    order = np.argsort(flat_r)
+    sorted_r = flat_r[order]
+    start = 0
+    while start < len(order):
+        num_bins = int(np.ceil(_max_sigmas / sorted_r[start])) + 1
+        end = min(
+            int(np.searchsorted(sorted_r, 2 * sorted_r[start], side="right")),
+            start + max(1, _max_grid_size // num_bins),
+        )
+        chunk = order[start:end]
+        j = np.arange(num_bins)
+        ret[chunk] = np.sum(terms(flat_r[chunk][:, None], j[None, :]), axis=1)
+        start = end
+    ret = ret.reshape(np.shape(r))
+    return float(ret) if ret.ndim == 0 else ret
+
+
+def _entropy_terms(r: np.ndarray, j: np.ndarray) -> np.ndarray:
+    p = p_function_gaussian(j, r, 1)
+    log_p = np.zeros(p.shape)
+    np.log2(p, out=log_p, where=p > 0)
+    return -np.where(j == 0, 1, 2) * p * log_p
+
+
+def _sq_err_terms(r: np.ndarray, j: np.ndarray) -> np.ndarray:
+    # integral of (x - c)**2 phi(x) over the bin [a, b] with center c = j r,
+    # in closed form (using x phi(x) = -phi'(x) for the standard normal
+    # density phi): P + a phi(a) - b phi(b) - 2 c (phi(a) - phi(b)) + c**2 P,
+    # where P is the probability of the bin
+    c = j * r
+    a = c - r / 2
+    b = c + r / 2
+    phi_a = np.exp(-a**2 / 2) / np.sqrt(2 * np.pi)
+    phi_b = np.exp(-b**2 / 2) / np.sqrt(2 * np.pi)
+    p = p_function_gaussian(j, r, 1)
+    sq_err = p * (1 + c**2) + a * phi_a - b * phi_b - 2 * c * (phi_a - phi_b)
+    return np.where(j == 0, 1, 2) * sq_err
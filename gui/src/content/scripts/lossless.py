@@ -0,0 +1,160 @@
+from typing import Dict, List, Optional, Tuple, Union
+import threading
+import numpy as np
+
+
+# Default compression level of each lossless method
+_default_levels: Dict[str, int] = {"zlib": 9, "zstd": 22, "lzma": 9}
+
+_method_aliases: Dict[str, str] = {"zstandard": "zstd"}
+
+
+class LosslessBackend:
+    """
+    A lossless compression method at a fixed level (and, for zstd, an
+    optional trained dictionary)
+
+    Compressor and decompressor contexts are created lazily, once per thread,
+    and reused across calls, so compressing many small buffers does not pay
+    the context setup cost each time. A backend can be shared between
+    threads; use get_lossless_backend to get the shared instance.
+    """
+
+    def __init__(
+        self, method: str, *, level: Optional[int] = None, dictionary: Optional[bytes] = None
+    ):
+        method = _method_aliases.get(method, method)
+        if method not in _default_levels:
+            raise ValueError(f"Unknown lossless compression method: {method}")
+        if dictionary is not None and method != "zstd":
+            raise ValueError("A dictionary is only supported for zstd")
+        self.method = method
+        self.level = level if level is not None else _default_levels[method]
+        self.dictionary = dictionary
+        self._zstd_dict = None
+        if dictionary is not None:
+            import zstandard as zstd
+
+            self._zstd_dict = zstd.ZstdCompressionDict(dictionary)
+            # the dictionary tables for this level are computed once and
+            # shared by every compressor context
+            self._zstd_dict.precompute_compress(level=self.level)
+        self._local = threading.local()
+
+    def compress(self, data: Union[bytes, np.ndarray]) -> bytes:
+        if isinstance(data, np.ndarray):
+            data = np.ascontiguousarray(data).tobytes()
+        if self.method == "zlib":
+            import zlib
+
+            return zlib.compress(data, level=self.level)
+        elif self.method == "lzma":
+            import lzma
+
+            return lzma.compress(data, preset=self.level)
+        return self._get_zstd_compressor().compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.method == "zlib":
+            import zlib
+
+            return zlib.decompress(data)
+        elif self.method == "lzma":
+            import lzma
+
+            return lzma.decompress(data)
+        return self._get_zstd_decompressor().decompress(data)
+
+    def compressed_size(self, data: Union[bytes, np.ndarray]) -> int:
+        return len(self.compress(data))
+
+    def _get_zstd_compressor(self):
+        cctx = getattr(self._local, "cctx", None)
+        if cctx is None:
+            import zstandard as zstd
+
+            if self._zstd_dict is not None:
+                cctx = zstd.ZstdCompressor(level=self.level, dict_data=self._zstd_dict)
+            else:
+                cctx = zstd.ZstdCompressor(level=self.level)
+            self._local.cctx = cctx
+        return cctx
+
+    def _get_zstd_decompressor(self):
+        dctx = getattr(self._local, "dctx", None)
+        if dctx is None:
+            import zstandard as zstd
+
+            if self._zstd_dict is not None:
+                dctx = zstd.ZstdDecompressor(dict_data=self._zstd_dict)
+            else:
+                dctx = zstd.ZstdDecompressor()
+            self._local.dctx = dctx
+        return dctx
+
+
+_backends: Dict[Tuple[str, int, Optional[bytes]], LosslessBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_lossless_backend(
+    method: str, *, level: Optional[int] = None, dictionary: Optional[bytes] = None
+) -> LosslessBackend:
+    """Shared LosslessBackend for a method, level and dictionary"""
+    method = _method_aliases.get(method, method)
+    if method not in _default_levels:
+        raise ValueError(f"Unknown lossless compression method: {method}")
+    if level is None:
+        level = _default_levels[method]
+    key = (method, level, dictionary)
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = LosslessBackend(method, level=level, dictionary=dictionary)
+            _backends[key] = backend
+    return backend
+
+
+def compress_buffer(
+    data: Union[bytes, np.ndarray],
+    method: str,
+    *,
+    level: Optional[int] = None,
+    dictionary: Optional[bytes] = None,
+) -> bytes:
+    return get_lossless_backend(method, level=level, dictionary=dictionary).compress(
+        data
+    )
+
+
+def train_zstd_dictionary(
+    samples: List[Union[bytes, np.ndarray]],
+    *,
+    dict_size: int = 16384,
+    level: int = _default_levels["zstd"],
+) -> bytes:
+    """
+    Train a zstd dictionary on representative buffers (e.g. the quantized
+    coefficients of a few segments)
+
+    A dictionary helps most when the buffers to compress are small (a few KB),
+    where zstd otherwise has little history to exploit. The returned bytes
+    can be stored alongside the compressed data and passed as the dictionary
+    argument of get_lossless_backend.
+    """
+    import zstandard as zstd
+
+    sample_bytes = [
+        np.ascontiguousarray(s).tobytes() if isinstance(s, np.ndarray) else bytes(s)
+        for s in samples
+    ]
+    if len(sample_bytes) == 0:
+        raise ValueError("At least one sample is required to train a dictionary")
+    # zstd needs several samples; split large buffers into dictionary-sized
+    # pieces so a handful of segments is enough to train on
+    pieces = []
+    for s in sample_bytes:
+        for i in range(0, len(s), dict_size):
+            pieces.append(s[i:i + dict_size])
+    dictionary = zstd.train_dictionary(dict_size, pieces, level=level)
+    return dictionary.as_bytes()
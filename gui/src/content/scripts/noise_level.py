@@ -0,0 +1,150 @@
+from typing import Dict, Tuple, Union
+from collections import OrderedDict
+import hashlib
+import numpy as np
+
+try:
+    from .filters import get_butter_sos
+except ImportError:
+    from filters import get_butter_sos
+
+
+# Signals longer than this many samples have their noise level estimated on
+# num_windows randomly placed windows instead of the whole signal
+default_max_samples = 300000
+default_num_windows = 32
+
+# Noise levels keyed by a hash of the samples they were computed from and the
+# estimation parameters, in least-recently-used order
+_noise_level_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_noise_level_cache_size = 64
+
+
+def estimate_noise_level(
+    array: np.ndarray,
+    *,
+    sampling_frequency: float,
+    lowcut: float = 300,
+    max_samples: int = default_max_samples,
+    num_windows: int = default_num_windows,
+    seed: int = 0,
+):
+    """
+    Noise level (MAD / 0.6745) of the high-pass filtered signal
+
+    For 2-D (samples x channels) input, returns an array of per-channel
+    levels, computed for all channels at once. Signals of up to max_samples
+    samples are filtered and measured as a whole. For longer signals the MAD
+    is measured on num_windows windows at random (seeded) positions, so only
+    about max_samples samples are read and filtered; each window is filtered
+    on its own, with a warm-up of ten periods of lowcut that is discarded.
+    See compare_noise_level_estimate for the deviation from the exact MAD.
+    """
+    return _estimate_noise_level(
+        array,
+        sampling_frequency=sampling_frequency,
+        lowcut=lowcut,
+        max_samples=max_samples,
+        num_windows=num_windows,
+        seed=seed,
+    )[0]
+
+
+def compare_noise_level_estimate(
+    array: np.ndarray,
+    *,
+    sampling_frequency: float,
+    lowcut: float = 300,
+    max_samples: int = default_max_samples,
+    num_windows: int = default_num_windows,
+    seed: int = 0,
+) -> Dict[str, np.ndarray]:
+    """
+    How far the windowed estimate deviates from the exact MAD
+
+    Returns the exact and windowed noise levels, the relative deviation
+    between them, and the relative standard error of the windowed estimate
+    predicted from the spread of the per-window MADs (which needs no exact
+    pass). Values are per channel.
+    """
+    kwargs = dict(sampling_frequency=sampling_frequency, lowcut=lowcut, num_windows=num_windows, seed=seed)
+    estimate, window_levels = _estimate_noise_level(array, max_samples=max_samples, with_window_levels=True, **kwargs)  # type: ignore
+    exact, _ = _estimate_noise_level(array, max_samples=array.shape[0], **kwargs)  # type: ignore
+    if len(window_levels) > 1:
+        standard_error = np.std(window_levels, axis=0, ddof=1) / np.sqrt(len(window_levels))
+    else:
+        standard_error = np.zeros_like(np.asarray(estimate, dtype=float))
+    return {
+        "exact": exact,
+        "estimate": estimate,
+        "relative_deviation": (estimate - exact) / exact,
+        "relative_standard_error": standard_error / estimate,
+    }
+
+
+def _estimate_noise_level(
+    array: np.ndarray,
+    *,
+    sampling_frequency: float,
+    lowcut: float,
+    max_samples: int,
+    num_windows: int,
+    seed: int,
+    with_window_levels: bool = False,
+) -> Tuple[Union[float, np.ndarray], np.ndarray]:
+    # returns the noise level and, with with_window_levels, the per-window
+    # levels (empty when the whole signal is used)
+    from scipy.signal import sosfilt
+
+    num_samples = array.shape[0]
+    sos = get_butter_sos(sampling_frequency, lowcut, None)
+    warmup = int(np.ceil(10 * sampling_frequency / lowcut))
+    window_length = max(1, max_samples // num_windows)
+    if num_samples <= max_samples or num_samples < num_windows * (window_length + warmup):
+        windows = [np.asarray(array)]
+        params = ("exact", sampling_frequency, lowcut)
+    else:
+        rng = np.random.default_rng(seed)
+        starts = np.sort(
+            rng.choice(num_samples - window_length - warmup, size=num_windows, replace=False)
+        )
+        windows = [np.asarray(array[s:s + warmup + window_length]) for s in starts]
+        params = ("windows", sampling_frequency, lowcut, warmup, window_length)
+
+    key = _get_cache_key(windows, params)
+    if key in _noise_level_cache and not with_window_levels:
+        _noise_level_cache.move_to_end(key)
+        noise_level = _noise_level_cache[key]
+        window_levels = None
+    else:
+        if len(windows) == 1:
+            filtered = sosfilt(sos, windows[0], axis=0)
+            window_levels = np.zeros((0,) + filtered.shape[1:])
+        else:
+            # (windows x samples x ...) filtered in one call, warm-up dropped
+            filtered = sosfilt(sos, np.stack(windows), axis=1)[:, warmup:]
+            window_levels = _mad(filtered, axis=1) / 0.6745 if with_window_levels else None
+            filtered = filtered.reshape((-1,) + filtered.shape[2:])
+        noise_level = _mad(filtered, axis=0) / 0.6745
+        _noise_level_cache[key] = noise_level
+        if len(_noise_level_cache) > _noise_level_cache_size:
+            _noise_level_cache.popitem(last=False)
+    if array.ndim == 1:
+        return float(noise_level), window_levels  # type: ignore
+    return noise_level.copy(), window_levels  # type: ignore
+
+
+def _mad(x: np.ndarray, *, axis: int) -> np.ndarray:
+    # the medians are taken along a contiguous last axis, which is much
+    # faster than partitioning along a strided one
+    x = np.ascontiguousarray(np.moveaxis(x, axis, -1))
+    x = np.abs(x - np.median(x, axis=-1, keepdims=True))
+    return np.median(x, axis=-1, overwrite_input=True)
+
+
+def _get_cache_key(windows: list, params: tuple) -> str:
+    h = hashlib.sha1(repr(params).encode())
+    for w in windows:
+        h.update(repr((w.shape, w.dtype.str)).encode())
+        h.update(np.ascontiguousarray(w).data)
+    return h.hexdigest()
@@ -0,0 +1,101 @@
+from typing import List, Optional, Sequence, Union
+import numpy as np
+
+
+_int16_min = np.iinfo(np.int16).min
+_int16_max = np.iinfo(np.int16).max
+
+
+def quantize(
+    data: np.ndarray,
+    *,
+    step: Union[float, np.ndarray] = 1,
+    deadzone: float = 0,
+    out: Optional[np.ndarray] = None,
+    scratch: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Round data / step to integers: int16, or int32 when the rounded values
+    do not fit in int16
+
+    step may be an array that broadcasts against data (e.g. one step per
+    channel). With a deadzone in [0, 0.5), values are rounded toward zero by
+    that amount, so the zero bin is widened to |data / step| < 0.5 + deadzone.
+
+    The division and rounding are done in place in scratch (a float64 array
+    of the same shape, allocated if not given), the range is checked once on
+    the rounded values, and the result is written to out when it has the
+    right dtype (int16, or int32 if needed) and shape.
+    """
+    if scratch is None or scratch.shape != data.shape:
+        scratch = np.empty(data.shape, dtype=np.float64)
+    np.divide(data, step, out=scratch)
+    if deadzone:
+        # the sign is taken back from data (steps are positive)
+        np.abs(scratch, out=scratch)
+        np.add(scratch, 0.5 - deadzone, out=scratch)
+        np.floor(scratch, out=scratch)
+        np.copysign(scratch, data, out=scratch)
+    else:
+        np.rint(scratch, out=scratch)
+    if scratch.size > 0 and (scratch.min() < _int16_min or scratch.max() > _int16_max):
+        dtype = np.int32
+    else:
+        dtype = np.int16
+    if out is None or out.dtype != dtype or out.shape != data.shape:
+        out = np.empty(data.shape, dtype=dtype)
+    np.copyto(out, scratch, casting="unsafe")
+    return out
+
+
+def quantize_coeffs(
+    coeffs: Sequence[np.ndarray],
+    quant_scale_factor: Union[float, np.ndarray],
+    *,
+    level_steps: Optional[Sequence[float]] = None,
+    deadzone: float = 0,
+) -> List[np.ndarray]:
+    """
+    Quantize a list of coefficient arrays with step quant_scale_factor
+    (times level_steps[i] for the i-th array, if given)
+    """
+    return [
+        quantize(
+            c,
+            step=quant_scale_factor if level_steps is None else quant_scale_factor * level_steps[i],
+            deadzone=deadzone,
+        )
+        for i, c in enumerate(coeffs)
+    ]
+
+
+class CoefficientQuantizer:
+    """
+    Quantizes a fixed list of coefficient arrays at many scale factors (as in
+    the scale-factor searches), reusing the same float scratch and integer
+    output buffers for every call
+
+    The arrays returned by quantize are overwritten by the next call; copy
+    them if they need to be kept.
+    """
+
+    def __init__(
+        self,
+        coeffs: Sequence[np.ndarray],
+        *,
+        level_steps: Optional[Sequence[float]] = None,
+        deadzone: float = 0,
+    ):
+        self.coeffs = list(coeffs)
+        self.level_steps = level_steps
+        self.deadzone = deadzone
+        self._scratch = [np.empty(c.shape, dtype=np.float64) for c in self.coeffs]
+        self._out: List[Optional[np.ndarray]] = [None] * len(self.coeffs)
+
+    def quantize(self, quant_scale_factor: Union[float, np.ndarray]) -> List[np.ndarray]:
+        for i, c in enumerate(self.coeffs):
+            step = quant_scale_factor if self.level_steps is None else quant_scale_factor * self.level_steps[i]
+            self._out[i] = quantize(
+                c, step=step, deadzone=self.deadzone, out=self._out[i], scratch=self._scratch[i]
+            )
+        return self._out  # type: ignore
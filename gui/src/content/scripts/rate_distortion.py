@@ -0,0 +1,158 @@
+from typing import List, Sequence
+import numpy as np
+
+# Candidate steps of each level, as multiples of the uniform step that would
+# give the target error at high rate. Levels can also be zeroed out entirely.
+_candidate_step_ratios = 2 ** np.linspace(-2, 6, 65)
+
+# Lagrange multipliers tried, as multiples of the slope of the uniform step
+_lagrange_multiplier_ratios = 2 ** np.linspace(-10, 10, 401)
+
+
+def compute_theoretical_bits_per_sample(coeffs_quantized, *, per_channel: bool = False):
+    """
+    Empirical entropy, in bits per value, of the quantized values of all the
+    arrays together
+
+    With per_channel, the arrays are (samples x channels) and an array of
+    per-channel entropies is returned.
+    """
+    return entropy_from_value_counts(compute_value_counts(coeffs_quantized, per_channel=per_channel))
+
+
+def compute_value_counts(coeffs_quantized, *, per_channel: bool = False) -> np.ndarray:
+    """
+    Histogram of the quantized values of all the arrays together
+
+    counts[k] is the number of values equal to k + (the smallest value). The
+    arrays are not concatenated or sorted: each is shifted by the smallest
+    value (into one reused index buffer) and added with np.bincount, so this
+    is a single pass over the values. With per_channel, the arrays are
+    (samples x channels) and the result is (channels x bins).
+    """
+    arrays = [c for c in coeffs_quantized if c.size > 0]
+    num_channels = arrays[0].shape[1] if per_channel and len(arrays) > 0 else 1
+    if len(arrays) == 0:
+        return np.zeros((num_channels, 0) if per_channel else 0, dtype=np.int64)
+    offset = min(int(np.min(c)) for c in arrays)
+    num_bins = max(int(np.max(c)) for c in arrays) - offset + 1
+    counts = np.zeros(num_channels * num_bins, dtype=np.int64)
+    buffer = np.empty(max(c.size for c in arrays), dtype=np.intp)
+    channel_offsets = np.arange(num_channels) * num_bins - offset if per_channel else None
+    for c in arrays:
+        indices = buffer[:c.size].reshape(c.shape)
+        if per_channel:
+            np.add(c, channel_offsets, out=indices, casting="unsafe")
+        else:
+            np.subtract(c, offset, out=indices, casting="unsafe")
+        counts += np.bincount(indices.ravel(), minlength=counts.size)
+    return counts.reshape(num_channels, num_bins) if per_channel else counts
+
+
+def entropy_from_value_counts(counts: np.ndarray):
+    """Entropy in bits per value of a histogram (along the last axis)"""
+    total = np.sum(counts, axis=-1, keepdims=True)
+    p = counts / np.where(total > 0, total, 1)
+    log_p = np.zeros(p.shape)
+    np.log2(p, out=log_p, where=counts > 0)
+    entropy = -np.sum(p * log_p, axis=-1)
+    return float(entropy) if entropy.ndim == 0 else entropy
+
+
+def optimize_level_steps(
+    coeffs: Sequence[np.ndarray],
+    *,
+    target_sq_err: float,
+) -> np.ndarray:
+    """
+    Quantization steps, one per coefficient array (wavelet level), that
+    minimize the estimated size at a total squared error of target_sq_err
+
+    The error is measured in the coefficient domain, so this assumes an
+    orthogonal transform (see estimate_nrmse_in_coefficient_domain in the
+    compression view). For each level the squared error and the rate
+    (compute_theoretical_bits_per_sample times the number of coefficients)
+    are tabulated for a grid of candidate steps, including one that zeroes
+    the level out. The steps are then chosen by reverse water-filling: for a
+    Lagrange multiplier lam, each level takes the candidate minimizing
+    error + lam * rate, and of the multipliers whose total error stays
+    within target_sq_err the one with the smallest total rate is used (a
+    single step for all levels is also considered). Levels whose variance is
+    below the water level are zeroed out; the others get nearly equal steps,
+    as a uniform step is already optimal at high rate.
+
+    The discrete choice usually lands somewhat below the target, so callers
+    are expected to rescale the returned steps by a common factor to hit the
+    target exactly.
+    """
+    coeffs = [np.asarray(c, dtype=float) for c in coeffs]
+    num_coeffs = sum(c.size for c in coeffs)
+    # D = n * s**2 / 12 for a fine uniform step s, where dD/dR = -s**2 ln2 / 6
+    uniform_step = np.sqrt(12 * target_sq_err / num_coeffs)
+    sq_errs, rates, steps = _get_level_tables(coeffs, uniform_step=uniform_step)
+
+    lagrange_multipliers = uniform_step**2 * np.log(2) / 6 * _lagrange_multiplier_ratios
+    # (multipliers x levels) choice of candidate
+    choices = np.argmin(sq_errs[None, :, :] + lagrange_multipliers[:, None, None] * rates[None, :, :], axis=2)
+    level_indices = np.arange(len(coeffs))
+    # a single step for all levels is also a candidate, so the result is
+    # never worse (under the rate model) than the uniform step on the grid
+    uniform_choices = np.tile(np.arange(len(_candidate_step_ratios))[:, None], (1, len(coeffs)))
+    choices = np.concatenate([choices, uniform_choices], axis=0)
+    total_sq_errs = np.sum(sq_errs[level_indices, choices], axis=1)
+    total_rates = np.sum(rates[level_indices, choices], axis=1)
+    feasible = np.flatnonzero(total_sq_errs <= target_sq_err)
+    if len(feasible) == 0:
+        # only reachable with the finest candidates
+        return steps[:, 0].copy()
+    best = feasible[np.argmin(total_rates[feasible])]
+    return steps[level_indices, choices[best]]
+
+
+def _get_level_tables(coeffs: List[np.ndarray], *, uniform_step: float):
+    # (levels x candidates) squared errors, rates in bits and steps; the last
+    # candidate of each level zeroes it out. Each level is sorted once and
+    # the quantizer bins of all candidate steps are located in the sorted
+    # values with one searchsorted, so the bin counts (for the same empirical
+    # entropy as compute_theoretical_bits_per_sample) and the squared errors
+    # (from prefix sums of the values and their squares) need no pass over
+    # the coefficients per candidate.
+    num_candidates = len(_candidate_step_ratios)
+    sq_errs = np.zeros((len(coeffs), num_candidates + 1))
+    rates = np.zeros((len(coeffs), num_candidates + 1))
+    steps = np.zeros((len(coeffs), num_candidates + 1))
+    candidate_steps = uniform_step * _candidate_step_ratios
+    for i, c in enumerate(coeffs):
+        x = np.sort(c.ravel())
+        n = x.size
+        steps[i, :-1] = candidate_steps
+        if n == 0:
+            steps[i, -1] = candidate_steps[-1]
+            continue
+        # every coefficient rounds to zero
+        steps[i, -1] = max(4 * max(-x[0], x[-1]), candidate_steps[-1])
+        sq_errs[i, -1] = np.dot(x, x)
+
+        # the bins of all candidates, concatenated
+        first_bins = np.rint(x[0] / candidate_steps)
+        num_bins = (np.rint(x[-1] / candidate_steps) - first_bins).astype(np.int64) + 1
+        offsets = np.concatenate([[0], np.cumsum(num_bins)])
+        candidate_index = np.repeat(np.arange(num_candidates), num_bins)
+        bins = first_bins[candidate_index] + (np.arange(offsets[-1]) - offsets[candidate_index])
+        bin_steps = candidate_steps[candidate_index]
+        upper = np.searchsorted(x, (bins + 0.5) * bin_steps)
+        upper[offsets[1:] - 1] = n
+        lower = np.empty_like(upper)
+        lower[1:] = upper[:-1]
+        lower[offsets[:-1]] = 0
+
+        cumsum = np.concatenate([[0], np.cumsum(x)])
+        cumsum_sq = np.concatenate([[0], np.cumsum(x * x)])
+        counts = upper - lower
+        centers = bins * bin_steps
+        bin_sq_errs = (cumsum_sq[upper] - cumsum_sq[lower]) - 2 * centers * (cumsum[upper] - cumsum[lower]) + counts * centers**2
+        p = counts / n
+        bin_bits = -p * np.log2(np.where(counts > 0, p, 1)) * n
+        sq_errs[i, :-1] = np.maximum(0, np.bincount(candidate_index, weights=bin_sq_errs, minlength=num_candidates))
+        rates[i, :-1] = np.bincount(candidate_index, weights=bin_bits, minlength=num_candidates)
+    return sq_errs, rates, steps
@@ -188,6 +188,13 @@ const run = async (
       packageFutures.push(pyodide.loadPackage("matplotlib"));
       // packageFutures.push(micropip.install("stanio"));
       packageFutures.push(pyodide.loadPackagesFromImports(script));
+      // modules shipped alongside the script may import packages that the
+      // script itself does not
+      for (const [filename, content] of Object.entries(additionalFiles || {})) {
+        if (filename.endsWith(".py") && typeof content === "string") {
+          packageFutures.push(pyodide.loadPackagesFromImports(content));
+        }
+      }
       for (const f of packageFutures) {
         await f;
       }
@@ -1,3 +1,12 @@
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import itertools
+import os
+import sys
+import tempfile
+import threading
 import time
 import pyodide_http
 pyodide_http.patch_all()
@@ -6,8 +15,276 @@ import urllib.request
 default_min_chunk_size = 100 * 1024
 default_max_cache_size = int(1e9)
 default_chunk_increment_factor = 1.7
+default_num_prefetch_workers = 4
+default_max_readahead_gap = 1024 * 1024
+default_max_disk_cache_size = 10 * 1024 * 1024 * 1024
 _num_request_retries = 8
 
+# Threads are not available in pyodide, where chunks are only fetched on demand
+_prefetch_supported = sys.platform != "emscripten"
+
+
+class DiskChunkCache:
+    def __init__(self, directory: str, *, max_size: int = default_max_disk_cache_size):
+        """A cache of file chunks on disk that can be shared by several processes and sessions.
+
+        Each chunk is a file named by the hash of its key (url, ETag, chunk size and chunk index). Files are written to a temporary name and renamed into place, so readers never see partial chunks and no locking is needed. When the total size exceeds max_size, the least recently used chunks (by modification time, which is updated on reads) are deleted until the cache is back to 90% of max_size.
+
+        Args:
+            directory (str): The directory of the cache. It is created if needed.
+            max_size (int, optional): The maximum number of bytes in the cache.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # estimate of the total size, corrected at each eviction (other
+        # processes may add or delete chunks meanwhile)
+        self._size = sum(size for _, size, _ in self._list_chunk_files())
+
+    @staticmethod
+    def chunk_key(url: str, etag: str, chunk_size: int, chunk_index: int):
+        return hashlib.sha1(f"{url}\n{etag}\n{chunk_size}\n{chunk_index}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """The chunk with this key, or None if it is not in the cache."""
+        path = self._get_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # not cached, or evicted by another process
+            return None
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        files = self._list_chunk_files()
+        files.sort(key=lambda f: f[2])
+        size = sum(size for _, size, _ in files)
+        for path, file_size, _ in files:
+            if size <= 0.9 * self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # evicted by another process
+            size -= file_size
+        self._size = size
+
+    def _list_chunk_files(self) -> List[Tuple[str, int, float]]:
+        # (path, size, modification time) of the chunk files
+        ret = []
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                ret.append((entry.path, st.st_size, st.st_mtime))
+        return ret
+
+    def _get_path(self, key: str):
+        return os.path.join(self.directory, key[:2], key)
+
+
+class _ReadStream:
+    def __init__(self, offset: int, end: int, stride: Optional[int]):
+        """A sequence of reads that are either sequential or separated by a constant stride.
+
+        The readahead works like a sliding window. When the reads reach the start of the last window that was requested (position >= window_start), the window size grows by the increment factor and the next windows are requested. Positions are chunk indices for sequential streams, read numbers for strided streams and hint numbers for hints.
+        """
+        # byte range of the last read
+        self.offset = offset
+        self.end = end
+        # bytes between the offsets of consecutive reads (candidate until it
+        # is seen twice), or None for a sequential stream
+        self.stride = stride
+        self.confirmed = False
+        self.num_reads = 0
+        self.readahead = 1
+        self.window_start = 0
+        self.requested_until = 0
+
+    def reset_window(self, position: int):
+        self.readahead = 1
+        self.window_start = position + 1
+        self.requested_until = position
+
+    def advance(self, position: int, *, increment_factor: float, max_readahead: int, min_readahead: int = 1, num_windows: int = 1) -> List[Tuple[int, int]]:
+        """The next windows of positions to request (first, last), if the reads reached the current one."""
+        if position < self.window_start:
+            return []
+        windows = []
+        for _ in range(num_windows):
+            self.readahead = min(max_readahead, max(self.readahead + 1, int(self.readahead * increment_factor + 0.5), min_readahead))
+            start = max(self.requested_until, position) + 1
+            self.window_start = start
+            self.requested_until = start + self.readahead - 1
+            windows.append((start, self.requested_until))
+        return windows
+
+
+class ReadaheadTracker:
+    def __init__(
+        self,
+        *,
+        chunk_size: int,
+        increment_factor: float,
+        max_readahead_chunks: int,
+        num_windows: int = 1,
+        max_streams: int = 8,
+        max_stride_chunks: int = 4096
+    ):
+        """Detects the access pattern of the reads of a RemoteFile and plans the readahead.
+
+        Up to max_streams interleaved streams are tracked (for example the reads of a dataset and the reads of the HDF5 B-tree that indexes it). A stream is sequential when each read starts in the last chunk of the previous one or in the next chunk, and strided when the offsets of three consecutive reads are equally spaced (in bytes, so HDF5 chunks that do not line up with the chunks of the RemoteFile are detected too). Hints (byte ranges that will be read in order, e.g. from get_dataset_chunk_ranges) take precedence over the detected patterns.
+
+        Args:
+            chunk_size (int): The size of the chunks of the RemoteFile.
+            increment_factor (float): The factor by which the readahead window grows.
+            max_readahead_chunks (int): The maximum number of chunks in a readahead window.
+            num_windows (int, optional): The number of successive windows requested at once, so that they can be loaded in parallel.
+            max_streams (int, optional): The maximum number of streams tracked at once. The least recently used stream is dropped first.
+            max_stride_chunks (int, optional): The largest stride (in chunks) that is detected.
+        """
+        self._chunk_size = chunk_size
+        self._increment_factor = increment_factor
+        self._max_readahead_chunks = max_readahead_chunks
+        self._num_windows = num_windows
+        self._max_streams = max_streams
+        self._max_stride = max_stride_chunks * chunk_size
+        # most recently used last
+        self._streams: List[_ReadStream] = []
+        # runs of chunks (first, last) of the hints
+        self._hints: List[Tuple[int, int]] = []
+        # chunk index -> position in _hints
+        self._hint_positions: Dict[int, int] = {}
+        self._hint_stream: Optional[_ReadStream] = None
+
+    def add_hints(self, byte_ranges: List[Tuple[int, int]]):
+        """Add byte ranges (offset, size) that will be read in this order."""
+        for offset, size in byte_ranges:
+            if size <= 0:
+                continue
+            first, last = offset // self._chunk_size, (offset + size - 1) // self._chunk_size
+            for chunk_index in range(first, last + 1):
+                self._hint_positions[chunk_index] = len(self._hints)
+            self._hints.append((first, last))
+
+    def access(self, offset: int, size: int) -> List[List[Tuple[int, int]]]:
+        """Record a read, and return the windows to read ahead, each as a list of runs of chunks (first, last)."""
+        windows = self._access_streams(offset, offset + size)
+        first_chunk = offset // self._chunk_size
+        if first_chunk in self._hint_positions:
+            return self._access_hints(self._hint_positions[first_chunk])
+        return windows
+
+    def _access_hints(self, position: int) -> List[List[Tuple[int, int]]]:
+        if self._hint_stream is None:
+            # the hints are known in advance, so the readahead starts at once
+            self._hint_stream = _ReadStream(0, 0, None)
+            self._hint_stream.reset_window(position - 1)
+        # the hinted runs vary in size, so each window is also limited to the
+        # maximum number of chunks
+        windows = []
+        for first_position, last_position in self._hint_stream.advance(position, increment_factor=self._increment_factor, max_readahead=len(self._hints), num_windows=self._num_windows):
+            runs = []
+            num_chunks = 0
+            for hint_position in range(first_position, min(last_position + 1, len(self._hints))):
+                first, last = self._hints[hint_position]
+                num_chunks += last - first + 1
+                if num_chunks > self._max_readahead_chunks and len(runs) > 0:
+                    self._hint_stream.requested_until = hint_position - 1
+                    break
+                runs.append((first, last))
+            if len(runs) == 0:
+                break
+            windows.append(runs)
+            if self._hint_stream.requested_until < last_position:
+                break
+        return windows
+
+    def _access_streams(self, offset: int, end: int) -> List[List[Tuple[int, int]]]:
+        first_chunk = offset // self._chunk_size
+        for i in range(len(self._streams) - 1, -1, -1):
+            s = self._streams[i]
+            if s.offset // self._chunk_size <= first_chunk <= (s.end - 1) // self._chunk_size + 1:
+                sequential = True
+            elif s.stride is not None and offset - s.offset == s.stride:
+                sequential = False
+            else:
+                continue
+            self._streams.append(self._streams.pop(i))
+            if sequential:
+                return self._continue_sequential_stream(s, offset, end)
+            return self._continue_strided_stream(s, offset, end)
+
+        # a new stream, with a candidate stride from the most recent stream
+        # that it could continue
+        stride = None
+        for s in reversed(self._streams):
+            if (s.end - 1) // self._chunk_size + 1 < first_chunk and offset - s.offset <= self._max_stride:
+                stride = offset - s.offset
+                break
+        s = _ReadStream(offset, end, stride)
+        s.reset_window((end - 1) // self._chunk_size)
+        self._streams.append(s)
+        if len(self._streams) > self._max_streams:
+            self._streams.pop(0)
+        return []
+
+    def _continue_sequential_stream(self, s: _ReadStream, offset: int, end: int) -> List[List[Tuple[int, int]]]:
+        if s.stride is not None:
+            s.stride = None
+            s.confirmed = False
+            s.reset_window((s.end - 1) // self._chunk_size)
+        s.offset, s.end = offset, max(s.end, end)
+        # at least as many chunks as the read, so that the windows stay ahead
+        # of large reads
+        num_chunks = (end - 1) // self._chunk_size - offset // self._chunk_size + 1
+        windows = s.advance((s.end - 1) // self._chunk_size, increment_factor=self._increment_factor, max_readahead=self._max_readahead_chunks, min_readahead=num_chunks, num_windows=self._num_windows)
+        return [[window] for window in windows]
+
+    def _continue_strided_stream(self, s: _ReadStream, offset: int, end: int) -> List[List[Tuple[int, int]]]:
+        if not s.confirmed:
+            s.confirmed = True
+            s.num_reads = 0
+            s.reset_window(0)
+        s.offset, s.end = offset, end
+        s.num_reads += 1
+        num_chunks = (end - 1) // self._chunk_size - offset // self._chunk_size + 1
+        max_reads = max(1, self._max_readahead_chunks // num_chunks)
+        windows = s.advance(s.num_reads, increment_factor=self._increment_factor, max_readahead=max_reads, num_windows=self._num_windows)
+        return [
+            [
+                ((offset + k * s.stride) // self._chunk_size, (end - 1 + k * s.stride) // self._chunk_size)
+                for k in range(first - s.num_reads, last - s.num_reads + 1)
+            ]
+            for first, last in windows
+        ]
+
 
 class RemoteFile:
     def __init__(
@@ -19,7 +296,10 @@ class RemoteFile:
         _min_chunk_size: int = default_min_chunk_size,
         _max_cache_size: int = default_max_cache_size,
         _chunk_increment_factor: float = default_chunk_increment_factor,
-        _max_chunk_size: int = 100 * 1024 * 1024
+        _max_chunk_size: int = 100 * 1024 * 1024,
+        _num_prefetch_workers: int = default_num_prefetch_workers,
+        _max_readahead_gap: int = default_max_readahead_gap,
+        disk_cache: Optional[DiskChunkCache] = None
     ):
         """Create a file-like object for reading a remote file. Optimized for reading hdf5 files. The arguments starting with an underscore are for testing and debugging purposes - they may experience breaking changes in the future.
 
@@ -27,25 +307,55 @@ class RemoteFile:
             url (str): The url of the remote file
             verbose (bool, optional): Whether to print info for debugging. Defaults to False.
             _min_chunk_size (int, optional): The minimum chunk size. When reading, the chunks will be loaded in multiples of this size.
-            _max_cache_size (int, optional): The maximum number of bytes to keep in the cache.
-            _chunk_increment_factor (int, optional): The factor by which to increase the number of chunks to load when the system detects that the chunks are being loaded in order.
+            _max_cache_size (int, optional): The maximum number of bytes to keep in the cache. The least recently used chunks are evicted first.
+            _chunk_increment_factor (int, optional): The factor by which to increase the readahead when the system detects that the chunks are being loaded in order (sequentially, with a constant stride, or as hinted).
             _max_chunk_size (int, optional): The maximum chunk size. When reading, the chunks will be loaded in multiples of the minimum chunk size up to this size.
+            _num_prefetch_workers (int, optional): The number of threads fetching the readahead in the background. Zero loads the readahead together with the reads. Ignored in pyodide, where there are no threads.
+            _max_readahead_gap (int, optional): Chunks of the readahead separated by at most this many bytes are loaded with a single request, including the bytes in between.
+            disk_cache (DiskChunkCache, optional): A cache of chunks on disk that persists across sessions. Chunks are keyed by the ETag of the file, so the cache is not used after the remote file changes. Defaults to None.
         """
         self._url = url
         self._verbose = verbose
         self._min_chunk_size = _min_chunk_size
-        self._max_chunks_in_cache = int(_max_cache_size / _min_chunk_size)
+        self._max_cache_size = _max_cache_size
         self._chunk_increment_factor = _chunk_increment_factor
         self._max_chunk_size = _max_chunk_size
-        self._chunks = {}
-        self._chunk_indices: list[
-            int
-        ] = (
-            []
-        )  # list of chunk indices in order of loading for purposes of cleaning up the cache
+        self._num_prefetch_workers = _num_prefetch_workers if _prefetch_supported else 0
+        self._max_readahead_gap_chunks = _max_readahead_gap // _min_chunk_size
+        # chunk index -> bytes, in order of last access
+        self._chunks: "OrderedDict[int, bytes]" = OrderedDict()
+        self._cache_size = 0
+        # chunk index -> (first chunk index, future) of the background request
+        # that is loading it
+        self._pending: Dict[int, Tuple[int, Future]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
         self._position = 0
-        self._smart_loader_last_chunk_index_accessed = -99
-        self._smart_loader_chunk_sequence_length = 1
+        self._readahead_max_chunks = max(1, _max_chunk_size // _min_chunk_size)
+        self._readahead = ReadaheadTracker(
+            chunk_size=_min_chunk_size,
+            increment_factor=_chunk_increment_factor,
+            max_readahead_chunks=self._readahead_max_chunks,
+            num_windows=max(1, self._num_prefetch_workers)
+        )
+        # readahead waiting for a read that misses (without prefetch workers)
+        self._deferred_readahead: List[int] = []
+        # chunks that were fetched and have not been read yet
+        self._unread_chunks = set()
+        self._stats = {
+            "num_reads": 0,
+            "num_chunk_reads": 0,
+            "num_chunk_hits": 0,
+            "num_requests": 0,
+            "bytes_fetched": 0,
+            "bytes_wasted": 0,
+            "bytes_from_disk_cache": 0
+        }
+        self._disk_cache = disk_cache
+        self._etag = None
+        if disk_cache is not None:
+            _, headers = RemoteFile._get_bytes(self._url, 0, 0, verbose=verbose, return_headers=True)
+            # without an ETag the size is the only way to tell versions apart
+            self._etag = headers.get("ETag") or f"size={size}"
 
         self.length = size
 
@@ -59,90 +369,174 @@ class RemoteFile:
             Exception: If the size argument is not provided.
 
         Returns:
-            bytes: The bytes read.
+            bytearray: The bytes read.
         """
         if size is None:
             raise Exception(
                 "The size argument must be provided in remfile"
             )  # pragma: no cover
+        buf = bytearray(max(0, min(size, self.length - self._position)))
+        self.readinto(buf)
+        return buf
 
+    def readinto(self, b):
+        """Read bytes from the file into a preallocated buffer (used by h5py).
+
+        Args:
+            b (bytearray | memoryview): The buffer to fill.
+
+        Returns:
+            int: The number of bytes read.
+        """
+        out = memoryview(b).cast("B")
+        size = max(0, min(len(out), self.length - self._position))
+        if size == 0:
+            return 0
         chunk_start_index = self._position // self._min_chunk_size
         chunk_end_index = (self._position + size - 1) // self._min_chunk_size
+        self._load_chunks(self._position, size)
+
+        offset = 0
+        chunk_offset = self._position % self._min_chunk_size
         for chunk_index in range(chunk_start_index, chunk_end_index + 1):
-            self._load_chunk(chunk_index)
-        if chunk_end_index == chunk_start_index:
-            chunk = self._chunks[chunk_start_index]
-            chunk_offset = self._position % self._min_chunk_size
-            chunk_length = size
-            self._position += size
-            ret = chunk[chunk_offset: chunk_offset + chunk_length]
-            return ret
-        else:
-            pieces_to_concat = []
-            for chunk_index in range(chunk_start_index, chunk_end_index + 1):
-                chunk = self._chunks[chunk_index]
-                if chunk_index == chunk_start_index:
-                    chunk_offset = self._position % self._min_chunk_size
-                    chunk_length = self._min_chunk_size - chunk_offset
-                elif chunk_index == chunk_end_index:
-                    chunk_offset = 0
-                    chunk_length = size - sum([len(p) for p in pieces_to_concat])
-                else:
-                    chunk_offset = 0
-                    chunk_length = self._min_chunk_size
-                pieces_to_concat.append(
-                    chunk[chunk_offset: chunk_offset + chunk_length]
-                )
-        ret = b"".join(pieces_to_concat)
+            chunk = self._chunks[chunk_index]
+            self._chunks.move_to_end(chunk_index)
+            if chunk_index in self._unread_chunks:
+                self._unread_chunks.remove(chunk_index)
+                self._stats["bytes_wasted"] -= len(chunk)
+            n = min(len(chunk) - chunk_offset, size - offset)
+            out[offset: offset + n] = chunk[chunk_offset: chunk_offset + n]
+            offset += n
+            chunk_offset = 0
         self._position += size
+        # evict only now, so that the chunks of this read stay in the cache
+        # until they are copied
+        self._evict_chunks()
+        return size
 
-        # clean up the cache
-        if len(self._chunk_indices) > self._max_chunks_in_cache:
-            if self._verbose:
-                print("Cleaning up cache")
-            for chunk_index in self._chunk_indices[
-                : int(self._max_chunks_in_cache * 0.5)
-            ]:
-                if chunk_index in self._chunks:
-                    del self._chunks[chunk_index]
-                else:
-                    # it is possible that the chunk was already deleted (repeated chunk index in the list)
-                    pass
-            self._chunk_indices = self._chunk_indices[
-                int(self._max_chunks_in_cache * 0.5):
-            ]
+    def add_readahead_hints(self, byte_ranges: List[Tuple[int, int]]):
+        """Announce byte ranges that are about to be read, in this order, so that they are read ahead (see get_dataset_chunk_ranges).
 
-        return ret
+        Args:
+            byte_ranges (list): The (offset, size) of each range.
+        """
+        self._readahead.add_hints(byte_ranges)
+
+    def get_stats(self):
+        """Counters of the reads and requests, for tuning the readahead.
+
+        Returns:
+            dict: num_reads, num_chunk_reads, num_chunk_hits (chunks that were cached or being read ahead when they were read), hit_rate, num_requests, bytes_fetched, bytes_wasted (fetched and not read so far) and bytes_from_disk_cache.
+        """
+        stats = dict(self._stats)
+        stats["hit_rate"] = stats["num_chunk_hits"] / stats["num_chunk_reads"] if stats["num_chunk_reads"] > 0 else 0
+        return stats
+
+    def _load_chunks(self, offset: int, size: int):
+        """Make sure that the chunks of a read are in the cache, and start the readahead.
 
-    def _load_chunk(self, chunk_index: int):
-        """Load a chunk of the file.
+        The chunks that are not cached are loaded with a single range request, or taken from the background requests that are already loading them. The readahead planned by the tracker is then loaded in the background (one window per request), or together with the missing chunks when there are no prefetch workers.
 
         Args:
-            chunk_index (int): The index of the chunk to load.
+            offset (int): The first byte of the read.
+            size (int): The number of bytes of the read.
         """
-        if chunk_index in self._chunks:
-            self._smart_loader_last_chunk_index_accessed = chunk_index
-            return
+        chunk_start_index = offset // self._min_chunk_size
+        chunk_end_index = (offset + size - 1) // self._min_chunk_size
+        self._stats["num_reads"] += 1
+        # finished background requests move to the cache, where they are
+        # subject to eviction
+        for chunk_index in [ci for ci, (start, future) in self._pending.items() if ci == start and future.done() and future.exception() is None]:
+            self._wait_for_prefetch(chunk_index)
+        missing = []
+        for chunk_index in range(chunk_start_index, chunk_end_index + 1):
+            self._stats["num_chunk_reads"] += 1
+            if chunk_index in self._chunks or chunk_index in self._pending:
+                self._stats["num_chunk_hits"] += 1
+            if chunk_index in self._pending:
+                self._wait_for_prefetch(chunk_index)
+            if chunk_index not in self._chunks:
+                chunk = self._get_chunk_from_disk_cache(chunk_index)
+                if chunk is not None:
+                    self._store_chunks(chunk_index, chunk)
+                else:
+                    missing.append(chunk_index)
+
+        # the chunks to read ahead, by window
+        readahead_windows = [
+            sorted(set(
+                chunk_index
+                for first, last in runs
+                for chunk_index in range(first, last + 1)
+                if chunk_index * self._min_chunk_size < self.length and chunk_index not in self._chunks and chunk_index not in self._pending
+            ))
+            for runs in self._readahead.access(offset, size)
+        ]
+        if self._num_prefetch_workers == 0:
+            # without threads the readahead is only worth loading when it
+            # comes with the missing chunks in the same requests, so it waits
+            # for the next read that misses
+            readahead = sorted(set(
+                [ci for ci in self._deferred_readahead if ci not in self._chunks] + [ci for window in readahead_windows for ci in window]
+            ))
+            if len(missing) == 0:
+                self._deferred_readahead = readahead[-self._readahead_max_chunks:]
+            else:
+                missing = [
+                    chunk_index
+                    for first, num_chunks in self._group_chunks(sorted(set(missing + readahead)), max_gap=self._max_readahead_gap_chunks)
+                    if any(first <= ci < first + num_chunks for ci in missing)
+                    for chunk_index in range(first, first + num_chunks)
+                ]
+                self._deferred_readahead = []
+            readahead_windows = []
+        # the missing chunks of the read itself are always loaded with one
+        # request (the cached chunks in between are loaded again)
+        max_gap = max(self._max_readahead_gap_chunks, chunk_end_index - chunk_start_index)
+        for first, num_chunks in self._group_chunks(missing, max_gap=max_gap):
+            if self._verbose:
+                print(
+                    f"Loading {num_chunks} chunks starting at {first} ({num_chunks * self._min_chunk_size/1e6} million bytes)"
+                )
+            x, fetched = self._fetch_chunks(first, num_chunks)
+            self._store_chunks(first, x, fetched=fetched)
+        # with threads the windows are requested separately, so that they
+        # are loaded in parallel
+        for window in readahead_windows:
+            for first, num_chunks in self._group_chunks(window, max_gap=self._max_readahead_gap_chunks):
+                self._prefetch(first, num_chunks)
 
-        if chunk_index == self._smart_loader_last_chunk_index_accessed + 1:
-            # round up to the chunk sequence length times 1.7
-            self._smart_loader_chunk_sequence_length = round(
-                self._smart_loader_chunk_sequence_length * 1.7 + 0.5
-            )
+    def _group_chunks(self, chunk_indices: List[int], *, max_gap: int):
+        """Group sorted chunk indices into runs (first, number of chunks) of at most the maximum chunk size, merging runs separated by at most max_gap chunks that are not being loaded in the background."""
+        max_run_length = max(1, self._max_chunk_size // self._min_chunk_size)
+        runs = []
+        for chunk_index in chunk_indices:
             if (
-                self._smart_loader_chunk_sequence_length > self._max_chunk_size / self._min_chunk_size
+                len(runs) > 0 and chunk_index - (runs[-1][0] + runs[-1][1]) <= max_gap and chunk_index - runs[-1][0] < max_run_length and
+                not any(ci in self._pending for ci in range(runs[-1][0] + runs[-1][1], chunk_index))
             ):
-                self._smart_loader_chunk_sequence_length = int(self._smart_loader_chunk_sequence_length / 1.7 + 0.5)
+                runs[-1] = (runs[-1][0], chunk_index - runs[-1][0] + 1)
+            else:
+                runs.append((chunk_index, 1))
+        return runs
+
+    def _fetch_chunks(self, chunk_index: int, num_chunks: int):
+        """Fetch a range of chunks (clipped to the end of the file) with a single request, unless they are all in the disk cache.
+
+        Returns:
+            tuple: The bytes, and whether they were fetched from the remote file.
+        """
         data_start = chunk_index * self._min_chunk_size
-        data_end = (
-            data_start + self._min_chunk_size * self._smart_loader_chunk_sequence_length - 1
-        )
-        if self._verbose:
-            print(
-                f"Loading {self._smart_loader_chunk_sequence_length} chunks starting at {chunk_index} ({(data_end - data_start + 1)/1e6} million bytes)"
-            )
-        if data_end >= self.length:
-            data_end = self.length - 1
+        data_end = min(data_start + num_chunks * self._min_chunk_size, self.length) - 1
+        if self._disk_cache is not None:
+            chunks = []
+            for i in range(num_chunks):
+                chunk = self._get_chunk_from_disk_cache(chunk_index + i)
+                if chunk is None:
+                    break
+                chunks.append(chunk)
+            if len(chunks) == num_chunks:
+                return b"".join(chunks), False
         x = RemoteFile._get_bytes(
             self._url,
             data_start,
@@ -150,20 +544,75 @@ class RemoteFile:
             verbose=self._verbose
         )
         assert x is not None
-        if self._smart_loader_chunk_sequence_length == 1:
-            self._chunks[chunk_index] = x
-            self._chunk_indices.append(chunk_index)
+        if self._disk_cache is not None:
+            for i in range(0, len(x), self._min_chunk_size):
+                key = self._get_disk_cache_key(chunk_index + i // self._min_chunk_size)
+                self._disk_cache.put(key, x[i: i + self._min_chunk_size])
+        return x, True
+
+    def _get_chunk_from_disk_cache(self, chunk_index: int) -> Optional[bytes]:
+        if self._disk_cache is None:
+            return None
+        return self._disk_cache.get(self._get_disk_cache_key(chunk_index))
+
+    def _get_disk_cache_key(self, chunk_index: int):
+        return DiskChunkCache.chunk_key(self._url, self._etag, self._min_chunk_size, chunk_index)
+
+    def _store_chunks(self, chunk_index: int, x: bytes, *, fetched: bool = False):
+        """Split loaded bytes into chunks and add them to the cache.
+
+        Args:
+            chunk_index (int): The index of the first chunk.
+            x (bytes): The bytes of the chunks.
+            fetched (bool, optional): Whether the bytes were fetched from the remote file (and count as unread until they are read) rather than loaded from the disk cache.
+        """
+        if fetched:
+            self._stats["num_requests"] += 1
+            self._stats["bytes_fetched"] += len(x)
         else:
-            for i in range(self._smart_loader_chunk_sequence_length):
-                if i * self._min_chunk_size >= len(x):
-                    break
-                self._chunks[chunk_index + i] = x[
-                    i * self._min_chunk_size: (i + 1) * self._min_chunk_size
-                ]
-                self._chunk_indices.append(chunk_index + i)
-        self._smart_loader_last_chunk_index_accessed = (
-            chunk_index + self._smart_loader_chunk_sequence_length - 1
-        )
+            self._stats["bytes_from_disk_cache"] += len(x)
+        view = memoryview(x)
+        for i in range(0, len(x), self._min_chunk_size):
+            ci = chunk_index + i // self._min_chunk_size
+            if ci in self._chunks:
+                self._cache_size -= len(self._chunks.pop(ci))
+            chunk = bytes(view[i: i + self._min_chunk_size]) if len(x) > self._min_chunk_size else x
+            self._chunks[ci] = chunk
+            self._cache_size += len(chunk)
+            if fetched and ci not in self._unread_chunks:
+                self._unread_chunks.add(ci)
+                self._stats["bytes_wasted"] += len(chunk)
+
+    def _evict_chunks(self):
+        """Evict the least recently used chunks until the cache fits in the maximum cache size."""
+        while self._cache_size > self._max_cache_size and len(self._chunks) > 1:
+            ci, evicted = self._chunks.popitem(last=False)
+            self._cache_size -= len(evicted)
+            # it stays wasted if it was never read
+            self._unread_chunks.discard(ci)
+
+    def _prefetch(self, chunk_index: int, num_chunks: int):
+        """Request a run of chunks in the background."""
+        # at most the maximum chunk size is requested ahead of the reads
+        if len(self._pending) * self._min_chunk_size >= self._max_chunk_size:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._num_prefetch_workers)
+        if self._verbose:
+            print(f"Prefetching {num_chunks} chunks starting at {chunk_index}")
+        future = self._executor.submit(self._fetch_chunks, chunk_index, num_chunks)
+        for i in range(num_chunks):
+            self._pending[chunk_index + i] = (chunk_index, future)
+
+    def _wait_for_prefetch(self, chunk_index: int):
+        """Wait for the background request that is loading a chunk and add its chunks to the cache."""
+        start, future = self._pending[chunk_index]
+        i = start
+        while self._pending.get(i, (None, None))[1] is future:
+            del self._pending[i]
+            i += 1
+        x, fetched = future.result()
+        self._store_chunks(start, x, fetched=fetched)
 
     def seek(self, offset: int, whence: int = 0):
         """Seek to a position in the file.
@@ -190,7 +639,10 @@ class RemoteFile:
         return self._position
 
     def close(self):
-        pass
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
 
     @staticmethod
     def _get_bytes(
@@ -198,7 +650,8 @@ class RemoteFile:
         start_byte: int,
         end_byte: int,
         *,
-        verbose=False
+        verbose=False,
+        return_headers=False
     ):
         """Get bytes from a remote file.
 
@@ -207,9 +660,10 @@ class RemoteFile:
             start_byte (int): The first byte to get.
             end_byte (int): The last byte to get.
             verbose (bool, optional): Whether to print info for debugging. Defaults to False.
+            return_headers (bool, optional): Whether to also return the response headers. Defaults to False.
 
         Returns:
-            _type_: _description_
+            bytes: The bytes, or (bytes, headers) if return_headers is set.
         """
         def fetch_bytes(range_start: int, range_end: int, num_retries: int, verbose: bool):
             """Fetch a range of bytes from a remote file using the range header
@@ -220,7 +674,7 @@ class RemoteFile:
                 num_retries (int): The number of retries.
 
             Returns:
-                bytes: The bytes fetched.
+                tuple: The bytes fetched and the response headers.
             """
             for try_num in range(num_retries + 1):
                 try:
@@ -229,7 +683,7 @@ class RemoteFile:
                     with urllib.request.urlopen(req) as response:
                         if response.status == 206:  # Partial Content status code
                             data = response.read()
-                            return data
+                            return data, response.headers
                         else:
                             raise Exception(f"Unexpected status code: {response.status}")
                 except Exception as e:
@@ -242,7 +696,51 @@ class RemoteFile:
                             print(f"Waiting {delay} seconds")
                         time.sleep(delay)
 
-        return fetch_bytes(start_byte, end_byte, _num_request_retries, verbose)
+        data, headers = fetch_bytes(start_byte, end_byte, _num_request_retries, verbose)
+        return (data, headers) if return_headers else data
+
+
+def get_dataset_chunk_ranges(dataset, selection) -> List[Tuple[int, int]]:
+    """The byte ranges of the HDF5 chunks of an h5py dataset that a selection touches, in the order in which h5py reads them. Pass them to RemoteFile.add_readahead_hints before reading the selection.
+
+    Args:
+        dataset (h5py.Dataset): The dataset.
+        selection (tuple): One slice (with step 1) or index per dimension, as in dataset[selection].
+
+    Returns:
+        list: The (offset, size) of each allocated chunk.
+    """
+    if not isinstance(selection, tuple):
+        selection = (selection,)
+    selection = selection + (slice(None),) * (len(dataset.shape) - len(selection))
+    bounds = []
+    for s, n in zip(selection, dataset.shape):
+        if isinstance(s, slice):
+            start, stop, _ = s.indices(n)
+        else:
+            start, stop = int(s) % n, int(s) % n + 1
+        if stop <= start:
+            return []
+        bounds.append((start, stop))
+    if dataset.chunks is None:
+        # contiguous layout: from the first to the last selected element
+        offset = dataset.id.get_offset()
+        if offset is None:
+            return []
+        strides = [dataset.dtype.itemsize] * len(bounds)
+        for i in range(len(bounds) - 2, -1, -1):
+            strides[i] = strides[i + 1] * dataset.shape[i + 1]
+        first = sum(start * st for (start, _), st in zip(bounds, strides))
+        last = sum((stop - 1) * st for (_, stop), st in zip(bounds, strides))
+        return [(offset + first, last - first + dataset.dtype.itemsize)]
+    ranges = []
+    for chunk_coords in itertools.product(*[
+        range(start // c * c, stop, c) for (start, stop), c in zip(bounds, dataset.chunks)
+    ]):
+        info = dataset.id.get_chunk_info_by_coord(chunk_coords)
+        if info.byte_offset is not None:
+            ranges.append((info.byte_offset, info.size))
+    return ranges
 
 if __name__ == "__main__":
     # https://neurosift.app/?p=/nwb&url=https://api.dandiarchive.org/api/assets/c04f6b30-82bf-40e1-9210-34f0bcd8be24/download/&dandisetId=000409&dandisetVersion=draft
@@ -255,6 +753,8 @@ if __name__ == "__main__":
     assert isinstance(acquisition, h5py.Group)
     d = acquisition['data']
     assert isinstance(d, h5py.Dataset)
+    f.add_readahead_hints(get_dataset_chunk_ranges(d, (slice(0, 30000), slice(101, 105))))
     x = d[:30000, 101:105]
     print(x.shape)
+    print(f.get_stats())
     h5f.close()
@@ -5,6 +5,7 @@ import { usePyodideResult } from "../../internal/pyodide/usePyodideResult";
 import { RemoteH5File } from "../../internal/remote-h5-file";
 import { removeMainSectionFromPy } from "../../internal/utils/removeMainSectionFromPy";
 import compression_py from "./compression.py?raw";
+import { compressionScriptFiles } from "./compressionScriptFiles";
 import CompressionPlotlyPlot from "./CompressionPlotlyPlot";
 import { SignalType } from "./selectors";
 
@@ -114,7 +115,8 @@ test_compression(
     nrmses=${JSON.stringify(nrmses)},
     filt_lowcut=${filtLowcut ? filtLowcut : "None"},
     filt_highcut=${filtHighcut ? filtHighcut : "None"},
-    signal_type='${signalType}'
+    signal_type='${signalType}',
+    seed=0
 )
   `;
   const signalFile: ArrayBuffer | null | undefined = useSignalFile(
@@ -123,8 +125,9 @@ test_compression(
   );
   const additionalFiles = useMemo(() => {
     if (signalFile === undefined) return undefined;
-    if (signalFile == null) return {};
+    if (signalFile == null) return { ...compressionScriptFiles };
     return {
+      ...compressionScriptFiles,
       "traces.dat": {
         base64: arrayBufferToBase64(signalFile),
       },
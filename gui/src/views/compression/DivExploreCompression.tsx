@@ -4,6 +4,7 @@ import LazyPlotlyPlot from "../../internal/Plotly/LazyPlotlyPlot";
 import { RemoteH5File } from "../../internal/remote-h5-file";
 import { removeMainSectionFromPy } from "../../internal/utils/removeMainSectionFromPy";
 import compression_py from "./compression.py?raw";
+import { compressionScriptFiles } from "./compressionScriptFiles";
 import {
   CompressionMethod,
   FilterSelector,
@@ -59,7 +60,8 @@ test_compression(
     nrmses=${JSON.stringify(nrmses)},
     filt_lowcut=${filtLowcut ? filtLowcut : "None"},
     filt_highcut=${filtHighcut ? filtHighcut : "None"},
-    signal_type='${signalType}'
+    signal_type='${signalType}',
+    seed=0
 )
 `;
   const signalFile: ArrayBuffer | null | undefined = useSignalFile(
@@ -68,8 +70,9 @@ test_compression(
   );
   const additionalFiles = useMemo(() => {
     if (signalFile === undefined) return undefined;
-    if (signalFile == null) return {};
+    if (signalFile == null) return { ...compressionScriptFiles };
     return {
+      ...compressionScriptFiles,
       "traces.dat": {
         base64: arrayBufferToBase64(signalFile),
       },
@@ -1,10 +1,45 @@
-from typing import Callable, Union, List
+from typing import Callable, Dict, Iterator, Tuple, Union, List
 import numpy as np
 import pywt
 
+try:
+    from filters import StreamingFilter, bandpass_filter, highpass_filter, lowpass_filter
+    from lossless import get_lossless_backend
+    from noise_level import estimate_noise_level
+    from quantization import CoefficientQuantizer, quantize_coeffs
+    from rate_distortion import compute_theoretical_bits_per_sample, optimize_level_steps
+    from coefficient_cache import coefficient_cache, get_content_key
+except ImportError:
+    # running from the source tree rather than in pyodide, where the shared
+    # modules are shipped next to this script
+    import os
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'content', 'scripts'))
+    from filters import StreamingFilter, bandpass_filter, highpass_filter, lowpass_filter
+    from lossless import get_lossless_backend
+    from noise_level import estimate_noise_level
+    from quantization import CoefficientQuantizer, quantize_coeffs
+    from rate_distortion import compute_theoretical_bits_per_sample, optimize_level_steps
+    from coefficient_cache import coefficient_cache, get_content_key
+
 
 wavelet_extension_mode = 'symmetric'
 
+# Segments are transformed independently so that a window can be decoded
+# without touching the rest of the recording. Wavelet segments use the
+# periodization mode, which does not add boundary coefficients (and is
+# orthogonal when the segment length is a multiple of 2**level).
+segment_wavelet_extension_mode = 'periodization'
+
+# In the fast search mode the quantization scale factor is searched with the
+# coefficient-domain NRMSE estimate and then verified with one exact
+# reconstruction. The result is accepted when the exact NRMSE is within this
+# relative tolerance of the target; otherwise the target is corrected by the
+# observed ratio and the search is repeated (falling back to the exact
+# search after _max_fast_search_corrections attempts).
+_fast_search_rtol = 1e-3
+_max_fast_search_corrections = 3
+
 def test_compression(*,
     wavelet_name: str,
     num_samples: int,  # only applies to synthetic data
@@ -12,155 +47,1002 @@ def test_compression(*,
     filt_lowcut: Union[float, None] = None,
     filt_highcut: Union[float, None] = None,
     lossless_compression_method: str = 'zstd',
-    signal_type: str = 'gaussian_noise'
+    signal_type: str = 'gaussian_noise',
+    fast_search: bool = True,
+    segment_length: Union[int, None] = None,
+    per_level_steps: bool = False,
+    seed: Union[int, None] = None
+):
+    """Compression results for each target NRMSE
+
+    With segment_length, the signal is transformed, quantized and
+    losslessly compressed in independent segments (see compute_coeffs), as
+    needed for random-access decompression.
+
+    With per_level_steps, each wavelet level gets its own quantization step
+    (see find_level_steps) instead of one step for all coefficients.
+
+    The filtered signal, coefficients and noise level come from
+    prepare_signal, so repeated calls on the same signal (for synthetic
+    data, the same seed) only redo the quantization and encoding.
+    """
+    original, sampling_frequency = _load_signal(signal_type, num_samples=num_samples, seed=seed)
+    original, coeffs, estimated_noise_level = prepare_signal(
+        original,
+        sampling_frequency=sampling_frequency,
+        wavelet_name=wavelet_name,
+        filt_lowcut=filt_lowcut,
+        filt_highcut=filt_highcut,
+        segment_length=segment_length,
+    )
+    original_size = original.nbytes
+
+    if per_level_steps:
+        if segment_length is not None:
+            raise ValueError('per_level_steps is not supported with segment_length')
+        quant_scale_factors = []
+        level_steps_list = []
+        for nrmse in nrmses:
+            quant_scale_factor, level_steps = find_level_steps(
+                original=original,
+                coeffs=coeffs,
+                wavelet_name=wavelet_name,
+                estimated_noise_level=estimated_noise_level,
+                target_nrmse=nrmse,
+            )
+            quant_scale_factors.append(quant_scale_factor)
+            level_steps_list.append(level_steps)
+    else:
+        quant_scale_factors = find_quant_scale_factors(
+            original=original,
+            coeffs=coeffs,
+            wavelet_name=wavelet_name,
+            estimated_noise_level=estimated_noise_level,
+            target_nrmses=nrmses,
+            fast_search=fast_search,
+            segment_length=segment_length,
+        )
+        level_steps_list = [None] * len(nrmses)
+
+    ret = []
+    for nrmse, quant_scale_factor, level_steps in zip(nrmses, quant_scale_factors, level_steps_list):
+        coeffs_quantized = quantize_coeffs(coeffs, quant_scale_factor, level_steps=level_steps)
+        compressed = reconstruct_from_coeffs(
+            scale_levels(coeffs_quantized, level_steps),
+            wavelet_name=wavelet_name,
+            num_samples=len(original),
+            segment_length=segment_length
+        ) * quant_scale_factor
+        compressed_size = get_compressed_size(
+            coeffs_quantized,
+            lossless_compression_method=lossless_compression_method,
+            wavelet_name=wavelet_name,
+            num_samples=len(original),
+            segment_length=segment_length
+        )
+        num_coeffs = sum(c.size for c in coeffs_quantized)
+        entropy = compute_theoretical_bits_per_sample(coeffs_quantized)  # entropy in bits per sample
+        theoretical_compressed_size = entropy * num_coeffs / 8
+        compression_ratio = original_size / compressed_size
+        theoretical_compression_ratio = original_size / theoretical_compressed_size
+        nrmse_actual = compute_nrmse(original, compressed, estimated_noise_level)
+
+        number_of_zeros = sum([np.count_nonzero(c == 0) for c in coeffs_quantized])
+        frac_of_zeros = number_of_zeros / num_coeffs
+        print(f'NRMSE: {nrmse:.2f}; Compression Ratio: {compression_ratio:.2f}; Fraction of zeros: {frac_of_zeros:.2f}')
+
+        result = {
+            'quant_scale_factor': quant_scale_factor,
+            'nrmse_target': nrmse,
+            'nrmse': nrmse_actual,
+            'compressed': compressed.tolist(),
+            'compression_ratio': compression_ratio,
+            'theoretical_compression_ratio': theoretical_compression_ratio,
+        }
+        if level_steps is not None:
+            result['level_steps'] = level_steps.tolist()
+        ret.append(result)
+    return {
+        'sampling_frequency': sampling_frequency,
+        'original': original.tolist(),
+        'compressed': ret,
+    }
+
+
+def test_compression_multichannel(*,
+    traces: np.ndarray,
+    sampling_frequency: float,
+    wavelet_name: str,
+    nrmses: List[float],
+    filt_lowcut: Union[float, None] = None,
+    filt_highcut: Union[float, None] = None,
+    lossless_compression_method: str = 'zstd',
+    fast_search: bool = True,
+    segment_length: Union[int, None] = None
 ):
+    """Channel-batched version of test_compression
+
+    The filters, the transform and the reconstruction run once on the whole
+    (samples x channels) block, and the quantization scale factors of all
+    channels are found together in one vectorized search. Each channel gets
+    its own noise level and scale factor, and is losslessly compressed on
+    its own.
+    """
+    if traces.ndim != 2:
+        raise ValueError('traces must be a 2-D (samples x channels) array')
+    original, coeffs, estimated_noise_levels = prepare_signal(
+        traces.astype(np.int16),
+        sampling_frequency=sampling_frequency,
+        wavelet_name=wavelet_name,
+        filt_lowcut=filt_lowcut,
+        filt_highcut=filt_highcut,
+        segment_length=segment_length,
+    )
+    num_channels = original.shape[1]
+    original_size_per_channel = original.nbytes / num_channels
+
+    all_quant_scale_factors = find_quant_scale_factors(
+        original=original,
+        coeffs=coeffs,
+        wavelet_name=wavelet_name,
+        estimated_noise_level=estimated_noise_levels,
+        target_nrmses=nrmses,
+        fast_search=fast_search,
+        segment_length=segment_length,
+    )
+
+    ret = []
+    for nrmse, quant_scale_factors in zip(nrmses, all_quant_scale_factors):
+        coeffs_quantized = quantize_coeffs(coeffs, quant_scale_factors)
+        compressed = reconstruct_from_coeffs(
+            coeffs_quantized,
+            wavelet_name=wavelet_name,
+            num_samples=original.shape[0],
+            segment_length=segment_length
+        ) * quant_scale_factors
+        nrmses_actual = compute_nrmse(original, compressed, estimated_noise_levels)
+        compression_ratios = []
+        # entropies of all channels from one histogram
+        entropies = compute_theoretical_bits_per_sample(coeffs_quantized, per_channel=True)
+        num_coeffs_per_channel = sum(c.shape[0] for c in coeffs_quantized)
+        theoretical_compression_ratios = (original_size_per_channel / (entropies * num_coeffs_per_channel / 8)).tolist()
+        for ch in range(num_channels):
+            compressed_size = get_compressed_size(
+                [c[:, ch] for c in coeffs_quantized],
+                lossless_compression_method=lossless_compression_method,
+                wavelet_name=wavelet_name,
+                num_samples=original.shape[0],
+                segment_length=segment_length
+            )
+            compression_ratios.append(original_size_per_channel / compressed_size)
+        ret.append({
+            'nrmse_target': nrmse,
+            'quant_scale_factors': quant_scale_factors.tolist(),
+            'nrmses': nrmses_actual.tolist(),
+            'compression_ratios': compression_ratios,
+            'theoretical_compression_ratios': theoretical_compression_ratios,
+        })
+    return {
+        'sampling_frequency': sampling_frequency,
+        'num_channels': num_channels,
+        'compressed': ret,
+    }
+
+
+def test_segmentation_loss(*,
+    wavelet_name: str,
+    num_samples: int,  # only applies to synthetic data
+    nrmse: float,
+    segment_lengths: List[int],
+    filt_lowcut: Union[float, None] = None,
+    filt_highcut: Union[float, None] = None,
+    lossless_compression_method: str = 'zstd',
+    signal_type: str = 'gaussian_noise',
+    window_length: int = 30000,
+    seed: Union[int, None] = None
+):
+    """Compression ratio lost to segmentation, and the decode time it saves
+
+    The signal is compressed at the target NRMSE as one block and with each
+    of segment_lengths. For each, the result holds the compression ratio,
+    its loss relative to the unsegmented transform, and the time to
+    reconstruct the whole signal and a window of window_length samples from
+    the middle of it.
+    """
+    import time
+    raw, sampling_frequency = _load_signal(signal_type, num_samples=num_samples, seed=seed)
+    original, estimated_noise_level = prepare_filtered_signal(
+        raw,
+        sampling_frequency=sampling_frequency,
+        filt_lowcut=filt_lowcut,
+        filt_highcut=filt_highcut,
+    )
+    num_samples = original.shape[0]
+    window_start = max(0, num_samples // 2 - window_length // 2)
+    window_end = min(num_samples, window_start + window_length)
+
+    ret = []
+    for segment_length in [None] + list(segment_lengths):
+        _, coeffs, _ = prepare_signal(
+            raw,
+            sampling_frequency=sampling_frequency,
+            wavelet_name=wavelet_name,
+            filt_lowcut=filt_lowcut,
+            filt_highcut=filt_highcut,
+            segment_length=segment_length,
+        )
+        quant_scale_factor = find_quant_scale_factor(
+            original=original,
+            coeffs=coeffs,
+            wavelet_name=wavelet_name,
+            estimated_noise_level=estimated_noise_level,
+            target_nrmse=nrmse,
+            fast_search=True,
+            segment_length=segment_length,
+        )
+        coeffs_quantized = quantize_coeffs(coeffs, quant_scale_factor)
+        compression_ratio = original.nbytes / get_compressed_size(
+            coeffs_quantized,
+            lossless_compression_method=lossless_compression_method,
+            wavelet_name=wavelet_name,
+            num_samples=num_samples,
+            segment_length=segment_length
+        )
+        timer = time.perf_counter()
+        reconstruct_from_coeffs(coeffs_quantized, wavelet_name=wavelet_name, num_samples=num_samples, segment_length=segment_length)
+        full_decode_time = time.perf_counter() - timer
+        timer = time.perf_counter()
+        if segment_length is None:
+            # without segments a window needs the full reconstruction
+            reconstruct_from_coeffs(coeffs_quantized, wavelet_name=wavelet_name, num_samples=num_samples)[window_start:window_end]
+        else:
+            reconstruct_window_from_coeffs(
+                coeffs_quantized,
+                wavelet_name=wavelet_name,
+                num_samples=num_samples,
+                segment_length=segment_length,
+                start_sample=window_start,
+                end_sample=window_end
+            )
+        window_decode_time = time.perf_counter() - timer
+        ret.append({
+            'segment_length': segment_length,
+            'quant_scale_factor': quant_scale_factor,
+            'compression_ratio': compression_ratio,
+            'compression_ratio_loss': 1 - compression_ratio / ret[0]['compression_ratio'] if ret else 0,
+            'full_decode_time_sec': full_decode_time,
+            'window_decode_time_sec': window_decode_time,
+        })
+        print(f'Segment length: {segment_length}; Compression Ratio: {compression_ratio:.2f}; Window decode time: {window_decode_time * 1000:.1f} ms')
+    return ret
+
+
+def _load_signal(signal_type: str, *, num_samples: int, seed: Union[int, None] = None):
     if signal_type == 'gaussian_noise':
         sampling_frequency = 30000
-        original = (np.random.randn(num_samples) * 100).astype(np.int16)
+        if seed is None:
+            original = (np.random.randn(num_samples) * 100).astype(np.int16)
+        else:
+            original = (np.random.default_rng(seed).standard_normal(num_samples) * 100).astype(np.int16)
     elif signal_type == 'real_ephys_1':
         sampling_frequency = 30000
-        fname = 'traces.dat'
-        with open(fname, 'rb') as f:
-            original = np.frombuffer(f.read(), dtype=np.int16)
+        original = RawTracesSource('traces.dat', sampling_frequency=sampling_frequency).get_traces()[:, 0]
     else:
         raise ValueError(f'Unknown signal type: {signal_type}')
+    return original, sampling_frequency
+
+
+def get_compressed_size(coeffs_quantized: list, *,
+    lossless_compression_method: str,
+    wavelet_name: str,
+    num_samples: int,
+    segment_length: Union[int, None] = None
+) -> int:
+    # with segments, each segment is compressed on its own so that it can be
+    # decompressed on its own
+    if segment_length is None:
+        blocks = [coeffs_quantized]
+    else:
+        blocks = split_segment_coeffs(coeffs_quantized, wavelet_name=wavelet_name, segment_ranges=get_segment_ranges(num_samples, segment_length))
+    # the blocks are concatenated into one reused buffer, which the lossless
+    # backends read directly
+    buffer = np.empty(max(sum(c.nbytes for c in block) for block in blocks) * 2, dtype=np.uint8)
+    compressed_size = 0
+    for block in blocks:
+        dtype = np.result_type(*block)
+        data = np.concatenate(block, out=buffer[:sum(c.size for c in block) * dtype.itemsize].view(dtype))
+        if lossless_compression_method == 'zlib':
+            compressed_size += len(zlib_compress(data))
+        elif lossless_compression_method == 'zstd':
+            compressed_size += len(zstandard_compress(data))
+        else:
+            raise ValueError(f'Unknown lossless compression method: {lossless_compression_method}')
+    return compressed_size
+
+
+class RawTracesSource:
+    """A raw binary recording (e.g. a .dat file), memory-mapped
+
+    The file holds num_channels interleaved channels (samples x channels in
+    C order) starting at byte offset. Nothing is read up front: get_traces
+    and iterate_blocks only touch the requested samples, so recordings much
+    larger than memory can be processed block by block.
+    """
+    def __init__(self, path: str, *,
+        num_channels: int = 1,
+        dtype: str = 'int16',
+        offset: int = 0,
+        sampling_frequency: float = 30000
+    ):
+        import os
+        itemsize = np.dtype(dtype).itemsize
+        num_samples = (os.path.getsize(path) - offset) // (itemsize * num_channels)
+        self._traces = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(num_samples, num_channels))
+        self.sampling_frequency = sampling_frequency
+
+    @property
+    def num_samples(self) -> int:
+        return self._traces.shape[0]
+
+    @property
+    def num_channels(self) -> int:
+        return self._traces.shape[1]
+
+    def get_traces(self, *,
+        start_sample: int = 0,
+        end_sample: Union[int, None] = None,
+        channel_indices: Union[List[int], None] = None
+    ) -> np.ndarray:
+        """Samples [start_sample, end_sample) of the given channels, as a (samples x channels) array"""
+        traces = self._traces[start_sample:end_sample]
+        if channel_indices is not None:
+            traces = traces[:, channel_indices]
+        return traces
+
+    def iterate_blocks(self, *,
+        block_length: int,
+        channel_indices: Union[List[int], None] = None
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (start_sample, block) for consecutive blocks of block_length samples"""
+        for start_sample in range(0, self.num_samples, block_length):
+            yield start_sample, np.array(self.get_traces(
+                start_sample=start_sample,
+                end_sample=start_sample + block_length,
+                channel_indices=channel_indices
+            ))
+
+
+def test_compression_blockwise(*,
+    source: RawTracesSource,
+    wavelet_name: str,
+    nrmses: List[float],
+    segment_length: int,
+    filt_lowcut: Union[float, None] = None,
+    filt_highcut: Union[float, None] = None,
+    lossless_compression_method: str = 'zstd',
+    channel_indices: Union[List[int], None] = None,
+    calibration_length: Union[int, None] = None,
+    segments_per_block: int = 16
+):
+    """Segmented compression of a recording, streamed block by block
+
+    The noise levels, the filter offsets and the per-channel quantization
+    scale factors are determined on a calibration window at the start of the
+    recording (10 seconds by default). The recording is then read in blocks
+    of segments_per_block segments, filtered (with the filter state carried
+    from block to block, so the result matches filtering the whole
+    recording), transformed and quantized segment by segment, and
+    compressed, so memory use is bounded by the block size rather than the
+    recording length. Results are as in test_compression_multichannel.
+    """
+    if calibration_length is None:
+        calibration_length = int(source.sampling_frequency * 10)
+    calibration = np.array(source.get_traces(end_sample=calibration_length, channel_indices=channel_indices))
+    num_channels = calibration.shape[1]
+    # as in _apply_filters, the median is subtracted before high-pass filtering
+    offset = np.median(calibration, axis=0) if filt_lowcut is not None else np.zeros(num_channels)
+
+    def create_filter():
+        streaming_filter = StreamingFilter(
+            sampling_frequency=source.sampling_frequency,
+            lowcut=filt_lowcut,
+            highcut=filt_highcut,
+        )
+        return lambda block: streaming_filter.process(block - offset).astype(np.int16)
+    calibration = create_filter()(calibration)
+    streaming_filter = create_filter()
+    calibration_coeffs = compute_coeffs(calibration, wavelet_name=wavelet_name, segment_length=segment_length)
+    estimated_noise_levels = estimate_noise_level(calibration, sampling_frequency=source.sampling_frequency)
+    all_quant_scale_factors = find_quant_scale_factors(
+        original=calibration,
+        coeffs=calibration_coeffs,
+        wavelet_name=wavelet_name,
+        estimated_noise_level=estimated_noise_levels,
+        target_nrmses=nrmses,
+        fast_search=True,
+        segment_length=segment_length,
+    )
+
+    sq_errs = np.zeros((len(nrmses), num_channels))
+    compressed_sizes = np.zeros((len(nrmses), num_channels))
+    segment_ranges = get_segment_ranges(source.num_samples, segment_length)
+    for i in range(0, len(segment_ranges), segments_per_block):
+        block_ranges = segment_ranges[i:i + segments_per_block]
+        block_start = block_ranges[0][0]
+        block = streaming_filter(np.array(source.get_traces(
+            start_sample=block_start,
+            end_sample=block_ranges[-1][1],
+            channel_indices=channel_indices
+        )))
+        for start, end in block_ranges:
+            segment = block[start - block_start:end - block_start]
+            coeffs = compute_coeffs(segment, wavelet_name=wavelet_name, segment_length=end - start)
+            for j, quant_scale_factors in enumerate(all_quant_scale_factors):
+                coeffs_quantized = quantize_coeffs(coeffs, quant_scale_factors)
+                reconstructed = reconstruct_from_coeffs(
+                    coeffs_quantized,
+                    wavelet_name=wavelet_name,
+                    num_samples=end - start,
+                    segment_length=end - start
+                ) * quant_scale_factors
+                sq_errs[j] += np.sum((segment.astype(float) - reconstructed) ** 2, axis=0)
+                for ch in range(num_channels):
+                    compressed_sizes[j, ch] += get_compressed_size(
+                        [c[:, ch] for c in coeffs_quantized],
+                        lossless_compression_method=lossless_compression_method,
+                        wavelet_name=wavelet_name,
+                        num_samples=end - start
+                    )
+
+    original_size_per_channel = source.num_samples * 2
+    ret = []
+    for j, (nrmse, quant_scale_factors) in enumerate(zip(nrmses, all_quant_scale_factors)):
+        ret.append({
+            'nrmse_target': nrmse,
+            'quant_scale_factors': quant_scale_factors.tolist(),
+            'nrmses': (np.sqrt(sq_errs[j] / source.num_samples) / estimated_noise_levels).tolist(),
+            'compression_ratios': (original_size_per_channel / compressed_sizes[j]).tolist(),
+        })
+    return {
+        'sampling_frequency': source.sampling_frequency,
+        'num_channels': num_channels,
+        'compressed': ret,
+    }
+
+
+def _apply_filters(
+    original: np.ndarray,
+    *,
+    sampling_frequency: float,
+    filt_lowcut: Union[float, None],
+    filt_highcut: Union[float, None]
+) -> np.ndarray:
+    # filters along the first axis, so 2-D input is filtered channel-wise
     if filt_lowcut is not None and filt_highcut is not None:
-        original = bandpass_filter(
-            original - np.median(original),  # subtracting the median avoids edge effects
+        return bandpass_filter(
+            original - np.median(original, axis=0),  # subtracting the median avoids edge effects
             sampling_frequency=sampling_frequency,
             lowcut=filt_lowcut,
             highcut=filt_highcut,
         ).astype(np.int16)
     elif filt_lowcut is not None:
-        original = highpass_filter(
-            original - np.median(original),  # subtracting the median avoids edge effects
+        return highpass_filter(
+            original - np.median(original, axis=0),  # subtracting the median avoids edge effects
             sampling_frequency=sampling_frequency,
             lowcut=filt_lowcut,
         ).astype(np.int16)
     elif filt_highcut is not None:
-        original = lowpass_filter(
+        return lowpass_filter(
             original,
             sampling_frequency=sampling_frequency,
             highcut=filt_highcut,
         ).astype(np.int16)
     else:
-        pass
-    original_size = original.nbytes
-    if wavelet_name == 'fourier':
-        original_fft = np.fft.rfft(original.astype(float))
-        coeffs = [np.real(original_fft), np.imag(original_fft)]
-    elif wavelet_name == "time-domain":
-        coeffs = [original]
+        return original
+
+
+def prepare_signal(
+    original: np.ndarray,
+    *,
+    sampling_frequency: float,
+    wavelet_name: str,
+    filt_lowcut: Union[float, None] = None,
+    filt_highcut: Union[float, None] = None,
+    segment_length: Union[int, None] = None
+) -> Tuple[np.ndarray, list, Union[float, np.ndarray]]:
+    """The filtered signal, its coefficients and its noise level
+
+    Memoized in coefficient_cache by the content of original and the
+    parameters, in two stages: the filtered signal and noise level (see
+    prepare_filtered_signal), then the coefficients of each wavelet and
+    segment length. The returned arrays are shared with the cache and must
+    not be modified.
+    """
+    filtered_key = _get_filtered_signal_key(original, sampling_frequency=sampling_frequency, filt_lowcut=filt_lowcut, filt_highcut=filt_highcut)
+    filtered, estimated_noise_level = _get_filtered_signal(
+        original,
+        key=filtered_key,
+        sampling_frequency=sampling_frequency,
+        filt_lowcut=filt_lowcut,
+        filt_highcut=filt_highcut,
+    )
+    key = get_content_key(
+        stage='coeffs',
+        filtered_key=filtered_key,
+        wavelet_name=wavelet_name,
+        segment_length=segment_length,
+        mode=wavelet_extension_mode if segment_length is None else segment_wavelet_extension_mode,
+    )
+    coeffs = coefficient_cache.get_or_compute(
+        key,
+        lambda: compute_coeffs(filtered, wavelet_name=wavelet_name, segment_length=segment_length)
+    )
+    return filtered, coeffs, estimated_noise_level
+
+
+def prepare_filtered_signal(
+    original: np.ndarray,
+    *,
+    sampling_frequency: float,
+    filt_lowcut: Union[float, None] = None,
+    filt_highcut: Union[float, None] = None
+) -> Tuple[np.ndarray, Union[float, np.ndarray]]:
+    """The filtered signal and its noise level, memoized in coefficient_cache"""
+    return _get_filtered_signal(
+        original,
+        key=_get_filtered_signal_key(original, sampling_frequency=sampling_frequency, filt_lowcut=filt_lowcut, filt_highcut=filt_highcut),
+        sampling_frequency=sampling_frequency,
+        filt_lowcut=filt_lowcut,
+        filt_highcut=filt_highcut,
+    )
+
+
+def _get_filtered_signal(
+    original: np.ndarray,
+    *,
+    key: str,
+    sampling_frequency: float,
+    filt_lowcut: Union[float, None],
+    filt_highcut: Union[float, None]
+) -> Tuple[np.ndarray, Union[float, np.ndarray]]:
+    def compute():
+        filtered = _apply_filters(
+            original,
+            sampling_frequency=sampling_frequency,
+            filt_lowcut=filt_lowcut,
+            filt_highcut=filt_highcut,
+        )
+        if filtered is original:
+            # the cache keeps its own copy of unfiltered input
+            filtered = np.array(original)
+        return filtered, estimate_noise_level(filtered, sampling_frequency=sampling_frequency)
+
+    return coefficient_cache.get_or_compute(key, compute)
+
+
+def _get_filtered_signal_key(original: np.ndarray, *, sampling_frequency: float, filt_lowcut, filt_highcut) -> str:
+    return get_content_key(
+        original,
+        stage='filtered',
+        sampling_frequency=sampling_frequency,
+        filt_lowcut=filt_lowcut,
+        filt_highcut=filt_highcut,
+    )
+
+
+def get_nrmse_for_quant_scale_factor(*,
+    original: np.ndarray,
+    coeffs: list,
+    quant_scale_factor: Union[float, np.ndarray],
+    wavelet_name: str,
+    estimated_noise_level: Union[float, np.ndarray],
+    segment_length: Union[int, None] = None,
+    quantizer: Union[CoefficientQuantizer, None] = None,
+    level_steps: Union[np.ndarray, None] = None
+):
+    # for a (samples x channels) original, quant_scale_factor and
+    # estimated_noise_level may be per-channel arrays and the result is
+    # per-channel. A quantizer for coeffs (with the same level_steps) lets
+    # repeated calls (as in the searches) reuse its buffers.
+    if quantizer is not None:
+        coeffs_quantized = quantizer.quantize(quant_scale_factor)
     else:
-        coeffs = pywt.wavedec(original, wavelet_name, mode=wavelet_extension_mode)
+        coeffs_quantized = quantize_coeffs(coeffs, quant_scale_factor, level_steps=level_steps)
+    compressed = reconstruct_from_coeffs(
+        scale_levels(coeffs_quantized, level_steps),
+        wavelet_name=wavelet_name,
+        num_samples=original.shape[0],
+        segment_length=segment_length
+    ) * quant_scale_factor
+    nrmse = compute_nrmse(original, compressed, estimated_noise_level)
+    return nrmse
 
-    estimated_noise_level = estimate_noise_level(original, sampling_frequency=sampling_frequency)
 
-    ret = []
-    for nrmse in nrmses:
-        quant_scale_factor = _monotonic_binary_search(
-            lambda x: get_nrmse_for_quant_scale_factor(
+def find_quant_scale_factors(*,
+    original: np.ndarray,
+    coeffs: list,
+    wavelet_name: str,
+    estimated_noise_level: Union[float, np.ndarray],
+    target_nrmses: List[float],
+    fast_search: bool,
+    segment_length: Union[int, None] = None
+) -> list:
+    """Find the quantization scale factors for several target NRMSEs
+
+    For a 1-D original all targets are solved together by
+    _monotonic_multi_target_search, so evaluations are shared between
+    targets. With fast_search, transforms for which the error can be
+    measured in the coefficient domain (see
+    estimate_nrmse_in_coefficient_domain) are searched without inverse
+    transforms, and each result is verified with an exact reconstruction.
+
+    For a (samples x channels) original each target is solved with
+    find_quant_scale_factor and the per-channel arrays are returned.
+    """
+    if original.ndim == 2:
+        return [
+            find_quant_scale_factor(
                 original=original,
+                coeffs=coeffs,
+                wavelet_name=wavelet_name,
+                estimated_noise_level=estimated_noise_level,
+                target_nrmse=target_nrmse,
+                fast_search=fast_search,
+                segment_length=segment_length,
+            )
+            for target_nrmse in target_nrmses
+        ]
+
+    quantizer = CoefficientQuantizer(coeffs)
+
+    def exact_nrmse(x):
+        return get_nrmse_for_quant_scale_factor(
+            original=original,
+            coeffs=coeffs,
+            quant_scale_factor=x,
+            wavelet_name=wavelet_name,
+            estimated_noise_level=estimated_noise_level,
+            segment_length=segment_length,
+            quantizer=quantizer
+        )
+
+    ret: List[Union[float, None]] = [None] * len(target_nrmses)
+    pending = list(range(len(target_nrmses)))
+    if fast_search and supports_coefficient_domain_nrmse(wavelet_name):
+        def estimated_nrmse(x):
+            return estimate_nrmse_in_coefficient_domain(
                 coeffs=coeffs,
                 quant_scale_factor=x,
                 wavelet_name=wavelet_name,
-                estimated_noise_level=estimated_noise_level
-            ),
-            target_value=nrmse,
+                num_samples=original.shape[0],
+                estimated_noise_level=estimated_noise_level,
+                segment_length=segment_length
+            )
+        estimate_table: Dict[float, float] = {}
+        target_values = list(target_nrmses)
+        for _ in range(_max_fast_search_corrections):
+            if len(pending) == 0:
+                break
+            quant_scale_factors = _monotonic_multi_target_search(
+                estimated_nrmse,
+                target_values=[target_values[i] for i in pending],
+                max_iterations=100,
+                tolerance=1e-3,
+                table=estimate_table,
+            )
+            still_pending = []
+            for i, quant_scale_factor in zip(pending, quant_scale_factors):
+                nrmse = exact_nrmse(quant_scale_factor)
+                if abs(nrmse - target_nrmses[i]) <= _fast_search_rtol * target_nrmses[i]:
+                    ret[i] = quant_scale_factor
+                elif nrmse > 0:
+                    # the estimate is off by a nearly constant factor (boundary
+                    # coefficients of non-periodized wavelet transforms)
+                    target_values[i] = target_values[i] * target_nrmses[i] / nrmse
+                    still_pending.append(i)
+            pending = still_pending
+        pending = [i for i in range(len(target_nrmses)) if ret[i] is None]
+    if len(pending) > 0:
+        quant_scale_factors = _monotonic_multi_target_search(
+            exact_nrmse,
+            target_values=[target_nrmses[i] for i in pending],
             max_iterations=100,
             tolerance=1e-3,
-            ascending=True,
         )
-        coeffs_quantized = [quantize(c / quant_scale_factor) for c in coeffs]
-        if wavelet_name == 'fourier':
-            compressed = np.fft.irfft(coeffs_quantized[0] + 1j * coeffs_quantized[1]) * quant_scale_factor
-        elif wavelet_name == 'time-domain':
-            compressed = coeffs_quantized[0] * quant_scale_factor
-        else:
-            compressed = pywt.waverec(coeffs_quantized, wavelet_name, mode=wavelet_extension_mode) * quant_scale_factor
-        if lossless_compression_method == 'zlib':
-            compressed_size = len(zlib_compress(np.concatenate(coeffs_quantized).tobytes()))
-        elif lossless_compression_method == 'zstd':
-            compressed_size = len(zstandard_compress(np.concatenate(coeffs_quantized).tobytes()))
-        else:
-            raise ValueError(f'Unknown lossless compression method: {lossless_compression_method}')
-        values, value_counts = np.unique(np.concatenate(coeffs_quantized), return_counts=True)
-        value_freqs = value_counts / sum(value_counts)
-        entropy = -sum([a * np.log2(a) for a in value_freqs])  # entropy in bits per sample
-        theoretical_compressed_size = entropy * len(np.concatenate(coeffs_quantized)) / 8
-        compression_ratio = original_size / compressed_size
-        theoretical_compression_ratio = original_size / theoretical_compressed_size
-        nrmse_actual = compute_nrmse(original, compressed, estimated_noise_level)
+        for i, quant_scale_factor in zip(pending, quant_scale_factors):
+            ret[i] = quant_scale_factor
+    return ret
 
-        number_of_zeros = sum([np.sum(c == 0) for c in coeffs_quantized])
-        frac_of_zeros = number_of_zeros / sum([c.size for c in coeffs_quantized])
-        print(f'NRMSE: {nrmse:.2f}; Compression Ratio: {compression_ratio:.2f}; Fraction of zeros: {frac_of_zeros:.2f}')
 
-        ret.append({
-            'quant_scale_factor': quant_scale_factor,
-            'nrmse_target': nrmse,
-            'nrmse': nrmse_actual,
-            'compressed': compressed.tolist(),
-            'compression_ratio': compression_ratio,
-            'theoretical_compression_ratio': theoretical_compression_ratio,
-        })
-    return {
-        'sampling_frequency': sampling_frequency,
-        'original': original.tolist(),
-        'compressed': ret,
-    }
+def find_quant_scale_factor(*,
+    original: np.ndarray,
+    coeffs: list,
+    wavelet_name: str,
+    estimated_noise_level: Union[float, np.ndarray],
+    target_nrmse: float,
+    fast_search: bool,
+    segment_length: Union[int, None] = None
+):
+    """Find the quantization scale factor that gives the target NRMSE
 
+    For a (samples x channels) original, one scale factor per channel is
+    returned and the channels are searched together. See
+    find_quant_scale_factors for fast_search.
+    """
+    if original.ndim == 1:
+        return find_quant_scale_factors(
+            original=original,
+            coeffs=coeffs,
+            wavelet_name=wavelet_name,
+            estimated_noise_level=estimated_noise_level,
+            target_nrmses=[target_nrmse],
+            fast_search=fast_search,
+            segment_length=segment_length,
+        )[0]
 
-def lowpass_filter(array, *, sampling_frequency, highcut) -> np.ndarray:
-    from scipy.signal import butter, lfilter
+    def search(func, target_value):
+        return _monotonic_binary_search_multichannel(
+            func,
+            target_value=target_value,
+            num_channels=original.shape[1],
+            max_iterations=100,
+            tolerance=1e-3,
+        )
 
-    nyquist = 0.5 * sampling_frequency
-    high = highcut / nyquist
-    b, a = butter(5, high, btype="low")
-    return lfilter(b, a, array, axis=0)  # type: ignore
+    quantizer = CoefficientQuantizer(coeffs)
 
+    def exact_nrmse(x):
+        return get_nrmse_for_quant_scale_factor(
+            original=original,
+            coeffs=coeffs,
+            quant_scale_factor=x,
+            wavelet_name=wavelet_name,
+            estimated_noise_level=estimated_noise_level,
+            segment_length=segment_length,
+            quantizer=quantizer
+        )
 
-def highpass_filter(array, *, sampling_frequency, lowcut) -> np.ndarray:
-    from scipy.signal import butter, lfilter
+    if fast_search and supports_coefficient_domain_nrmse(wavelet_name):
+        def estimated_nrmse(x):
+            return estimate_nrmse_in_coefficient_domain(
+                coeffs=coeffs,
+                quant_scale_factor=x,
+                wavelet_name=wavelet_name,
+                num_samples=original.shape[0],
+                estimated_noise_level=estimated_noise_level,
+                segment_length=segment_length
+            )
+        target_value = np.full(original.shape[1], target_nrmse)
+        for _ in range(_max_fast_search_corrections):
+            quant_scale_factor = search(estimated_nrmse, target_value)
+            nrmse = exact_nrmse(quant_scale_factor)
+            accepted = np.abs(nrmse - target_nrmse) <= _fast_search_rtol * target_nrmse
+            if np.all(accepted):
+                return quant_scale_factor
+            if np.any(nrmse == 0):
+                break
+            # the estimate is off by a nearly constant factor (boundary
+            # coefficients of non-periodized wavelet transforms)
+            target_value = np.where(accepted, target_value, target_value * target_nrmse / nrmse)
+    return search(exact_nrmse, target_nrmse)
 
-    nyquist = 0.5 * sampling_frequency
-    low = lowcut / nyquist
-    b, a = butter(5, low, btype="high")
-    return lfilter(b, a, array, axis=0)  # type: ignore
 
+def find_level_steps(*,
+    original: np.ndarray,
+    coeffs: list,
+    wavelet_name: str,
+    estimated_noise_level: float,
+    target_nrmse: float
+) -> Tuple[float, np.ndarray]:
+    """Per-level quantization steps that give the target NRMSE
+
+    Returns (quant_scale_factor, level_steps): level i is quantized with step
+    quant_scale_factor * level_steps[i]. The relative steps are chosen by
+    optimize_level_steps in the coefficient domain, which needs an orthogonal
+    wavelet and a 1-D original. The common scale factor is then corrected
+    with exact reconstructions until the NRMSE is within _fast_search_rtol of
+    the target, falling back to a binary search.
+    """
+    if wavelet_name in ('fourier', 'time-domain') or not supports_coefficient_domain_nrmse(wavelet_name):
+        raise ValueError(f'Per-level steps need an orthogonal wavelet, not {wavelet_name}')
+    if original.ndim != 1:
+        raise ValueError('Per-level steps are only supported for 1-D signals')
+    num_samples = original.shape[0]
+    target_sq_err = (target_nrmse * estimated_noise_level) ** 2 * num_samples
+    steps = optimize_level_steps(coeffs, target_sq_err=target_sq_err)
+    quant_scale_factor = float(np.min(steps))
+    level_steps = steps / quant_scale_factor
 
-def bandpass_filter(array, *, sampling_frequency, lowcut, highcut) -> np.ndarray:
-    from scipy.signal import butter, lfilter
+    quantizer = CoefficientQuantizer(coeffs, level_steps=level_steps)
 
-    nyquist = 0.5 * sampling_frequency
-    low = lowcut / nyquist
-    high = highcut / nyquist
-    b, a = butter(5, [low, high], btype="band")
-    return lfilter(b, a, array, axis=0)  # type: ignore
+    def exact_nrmse(x):
+        return get_nrmse_for_quant_scale_factor(
+            original=original,
+            coeffs=coeffs,
+            quant_scale_factor=x,
+            wavelet_name=wavelet_name,
+            estimated_noise_level=estimated_noise_level,
+            quantizer=quantizer,
+            level_steps=level_steps
+        )
 
+    # the NRMSE is nearly proportional to the step
+    for _ in range(_max_fast_search_corrections):
+        nrmse = exact_nrmse(quant_scale_factor)
+        if abs(nrmse - target_nrmse) <= _fast_search_rtol * target_nrmse:
+            return quant_scale_factor, level_steps
+        if nrmse == 0:
+            break
+        quant_scale_factor = quant_scale_factor * target_nrmse / nrmse
+    quant_scale_factor = _monotonic_binary_search(
+        exact_nrmse,
+        target_value=target_nrmse,
+        max_iterations=100,
+        tolerance=1e-3,
+        ascending=True,
+    )
+    return quant_scale_factor, level_steps
 
-def get_nrmse_for_quant_scale_factor(*,
-    original: np.ndarray,
+
+def scale_levels(coeffs_quantized: list, level_steps: Union[np.ndarray, None]) -> list:
+    # the quantized levels in units of quant_scale_factor, as reconstruct_from_coeffs expects
+    if level_steps is None:
+        return coeffs_quantized
+    return [c * s for c, s in zip(coeffs_quantized, level_steps)]
+
+
+def supports_coefficient_domain_nrmse(wavelet_name: str) -> bool:
+    if wavelet_name in ('fourier', 'time-domain'):
+        return True
+    return bool(pywt.Wavelet(wavelet_name).orthogonal)
+
+
+def estimate_nrmse_in_coefficient_domain(*,
     coeffs: list,
-    quant_scale_factor: float,
+    quant_scale_factor: Union[float, np.ndarray],
     wavelet_name: str,
-    estimated_noise_level: float
+    num_samples: int,
+    estimated_noise_level: Union[float, np.ndarray],
+    segment_length: Union[int, None] = None
 ):
-    coeffs_quantized = [quantize(c / quant_scale_factor) for c in coeffs]
-    if wavelet_name == 'fourier':
-        compressed = np.fft.irfft(coeffs_quantized[0] + 1j * coeffs_quantized[1]) * quant_scale_factor
-    elif wavelet_name == 'time-domain':
-        compressed = coeffs_quantized[0] * quant_scale_factor
+    """NRMSE of quantizing the coefficients, measured without an inverse transform
+
+    By Parseval's theorem the reconstruction error of an orthogonal
+    transform equals the error of its coefficients. This is exact for
+    'time-domain' and 'fourier' (rfft), and for orthogonal wavelets up to the
+    boundary coefficients of the (non-periodized) extension mode. With
+    segment_length, the errors of the segments are added up.
+    """
+    if segment_length is not None:
+        segment_ranges = get_segment_ranges(num_samples, segment_length)
+        sq_err = 0
+        for (start, end), segment_coeffs in zip(segment_ranges, split_segment_coeffs(coeffs, wavelet_name=wavelet_name, segment_ranges=segment_ranges)):
+            sq_err = sq_err + _coefficient_domain_sq_err(segment_coeffs, quant_scale_factor=quant_scale_factor, wavelet_name=wavelet_name, num_samples=end - start)
     else:
-        compressed = pywt.waverec(coeffs_quantized, wavelet_name, mode=wavelet_extension_mode) * quant_scale_factor
-    nrmse = compute_nrmse(original, compressed, estimated_noise_level)
-    return nrmse
+        sq_err = _coefficient_domain_sq_err(coeffs, quant_scale_factor=quant_scale_factor, wavelet_name=wavelet_name, num_samples=num_samples)
+    return np.sqrt(sq_err / num_samples) * quant_scale_factor / estimated_noise_level
+
 
+def _coefficient_domain_sq_err(coeffs: list, *, quant_scale_factor: Union[float, np.ndarray], wavelet_name: str, num_samples: int):
+    # sum of squared errors (in units of the quantization step) of one block
+    sq_err = 0
+    if wavelet_name == 'fourier':
+        # irfft counts the interior bins twice and ignores the imaginary
+        # parts of the DC and Nyquist bins
+        num_bins = coeffs[0].shape[0]
+        weights_real = np.full(num_bins, 2.0)
+        weights_real[0] = 1
+        if num_samples % 2 == 0:
+            weights_real[-1] = 1
+        weights_imag = weights_real.copy()
+        weights_imag[0] = 0
+        if num_samples % 2 == 0:
+            weights_imag[-1] = 0
+        for c, w in ((coeffs[0], weights_real), (coeffs[1], weights_imag)):
+            x = c / quant_scale_factor
+            if c.ndim == 2:
+                w = w[:, None]
+            sq_err = sq_err + np.sum(w * (x - np.round(x)) ** 2, axis=0)
+        return sq_err / num_samples
+    for c in coeffs:
+        x = c / quant_scale_factor
+        sq_err = sq_err + np.sum((x - np.round(x)) ** 2, axis=0)
+    return sq_err
 
-def compute_nrmse(original: np.ndarray, compressed: np.ndarray, estimated_noise_level: float) -> float:
+
+def compute_nrmse(original: np.ndarray, compressed: np.ndarray, estimated_noise_level) -> float:
+    # computed along the first axis, so 2-D (samples x channels) input gives per-channel values
     x = original.astype(float)
     y = compressed.astype(float)
-    return np.sqrt(np.mean((x - y) ** 2)) / estimated_noise_level
+    return np.sqrt(np.mean((x - y) ** 2, axis=0)) / estimated_noise_level
+
+
+def compute_coeffs(original: np.ndarray, *, wavelet_name: str, segment_length: Union[int, None] = None) -> list:
+    # transform along the first axis (samples), so 2-D input is handled channel-wise
+    if segment_length is not None:
+        # the coefficient arrays of all segments, in order
+        coeffs = []
+        for start, end in get_segment_ranges(original.shape[0], segment_length):
+            coeffs.extend(_compute_block_coeffs(original[start:end], wavelet_name=wavelet_name, mode=segment_wavelet_extension_mode))
+        return coeffs
+    return _compute_block_coeffs(original, wavelet_name=wavelet_name, mode=wavelet_extension_mode)
+
+
+def reconstruct_from_coeffs(coeffs: list, *, wavelet_name: str, num_samples: int, segment_length: Union[int, None] = None) -> np.ndarray:
+    if segment_length is not None:
+        segment_ranges = get_segment_ranges(num_samples, segment_length)
+        return np.concatenate([
+            _reconstruct_block(segment_coeffs, wavelet_name=wavelet_name, num_samples=end - start, mode=segment_wavelet_extension_mode)
+            for (start, end), segment_coeffs in zip(segment_ranges, split_segment_coeffs(coeffs, wavelet_name=wavelet_name, segment_ranges=segment_ranges))
+        ], axis=0)
+    return _reconstruct_block(coeffs, wavelet_name=wavelet_name, num_samples=num_samples, mode=wavelet_extension_mode)
+
+
+def reconstruct_window_from_coeffs(coeffs: list, *, wavelet_name: str, num_samples: int, segment_length: int, start_sample: int, end_sample: int) -> np.ndarray:
+    """Reconstruct samples [start_sample, end_sample) of a segmented transform
+
+    Only the segments covering the window are inverted, so the cost scales
+    with the window rather than with num_samples.
+    """
+    segment_ranges = get_segment_ranges(num_samples, segment_length)
+    segment_coeffs = split_segment_coeffs(coeffs, wavelet_name=wavelet_name, segment_ranges=segment_ranges)
+    indices = [i for i, (start, end) in enumerate(segment_ranges) if start < end_sample and end > start_sample]
+    x = np.concatenate([
+        _reconstruct_block(segment_coeffs[i], wavelet_name=wavelet_name, num_samples=segment_ranges[i][1] - segment_ranges[i][0], mode=segment_wavelet_extension_mode)
+        for i in indices
+    ], axis=0)
+    offset = segment_ranges[indices[0]][0]
+    return x[start_sample - offset:end_sample - offset]
+
+
+def get_segment_ranges(num_samples: int, segment_length: int) -> List[tuple]:
+    # as in qfc: fixed-length segments, with the final segment lengthened to
+    # at least half a segment by borrowing from the one before it
+    if segment_length <= 0 or segment_length >= num_samples:
+        return [(0, num_samples)]
+    segment_ranges = [(start, min(start + segment_length, num_samples)) for start in range(0, num_samples, segment_length)]
+    size_of_final_segment = segment_ranges[-1][1] - segment_ranges[-1][0]
+    if size_of_final_segment < segment_length // 2:
+        adjustment = segment_length // 2 - size_of_final_segment
+        segment_ranges[-2] = (segment_ranges[-2][0], segment_ranges[-2][1] - adjustment)
+        segment_ranges[-1] = (segment_ranges[-1][0] - adjustment, segment_ranges[-1][1])
+    return segment_ranges
+
+
+def split_segment_coeffs(coeffs: list, *, wavelet_name: str, segment_ranges: List[tuple]) -> List[list]:
+    """Group the flat coefficient list of a segmented transform by segment"""
+    ret = []
+    i = 0
+    for start, end in segment_ranges:
+        if wavelet_name == 'fourier':
+            n = 2
+        elif wavelet_name == 'time-domain':
+            n = 1
+        else:
+            n = pywt.dwt_max_level(end - start, pywt.Wavelet(wavelet_name).dec_len) + 1
+        ret.append(coeffs[i:i + n])
+        i += n
+    return ret
+
+
+def _compute_block_coeffs(original: np.ndarray, *, wavelet_name: str, mode: str) -> list:
+    if wavelet_name == 'fourier':
+        original_fft = np.fft.rfft(original.astype(float), axis=0)
+        return [np.real(original_fft), np.imag(original_fft)]
+    elif wavelet_name == "time-domain":
+        return [original]
+    else:
+        return pywt.wavedec(original, wavelet_name, mode=mode, axis=0)
+
+
+def _reconstruct_block(coeffs: list, *, wavelet_name: str, num_samples: int, mode: str) -> np.ndarray:
+    if wavelet_name == 'fourier':
+        return np.fft.irfft(coeffs[0] + 1j * coeffs[1], n=num_samples, axis=0)
+    elif wavelet_name == 'time-domain':
+        return coeffs[0]
+    else:
+        # waverec returns one extra sample for odd lengths
+        return pywt.waverec(coeffs, wavelet_name, mode=mode, axis=0)[:num_samples]
 
 
 def _monotonic_binary_search(
@@ -234,31 +1116,162 @@ def _monotonic_binary_search(
     return (upper_bound + lower_bound) / 2
 
 
-def quantize(data: np.ndarray) -> np.ndarray:
-    data_rounded = np.round(data)
-    # check that it is within the range of int16
-    if np.min(data_rounded) < np.iinfo(np.int16).min or np.max(data_rounded) > np.iinfo(np.int16).max:
-        # this happens for real data and Fourier method
-        print('Warning: data is out of range of int16. Using int32 instead.')
-        return np.round(data).astype(np.int32)
-    return np.round(data).astype(np.int16)
+def _monotonic_multi_target_search(
+    func: Callable[[float], float],
+    target_values: List[float],
+    max_iterations: int,
+    tolerance: float,
+    table: Union[Dict[float, float], None] = None,
+) -> List[float]:
+    """
+    Solves _monotonic_binary_search (ascending case) for several target
+    values in one pass
+
+    Every evaluation of func is recorded in a table of input -> output
+    values shared by all the targets. The upper bound is found once, for the
+    largest target, and the targets are then solved in increasing order,
+    each starting from the tightest bracket in the table, which includes
+    the evaluations made for its neighbors.
+
+    Parameters
+    ----------
+    func : callable
+        The function, assumed to be monotonically increasing
+    target_values : list of float
+        The target values
+    max_iterations : int
+        The maximum number of iterations for the upper bound search and for
+        the binary search of each target
+    tolerance : float
+        The tolerance for the width of the search interval
+    table : dict, optional
+        Table of previous evaluations of func to reuse; it is updated in place
+
+    Returns
+    -------
+    list of float
+        The values for each target, in the order of target_values
+    """
+    if table is None:
+        table = {}
+
+    def evaluate(x):
+        if x not in table:
+            table[x] = func(x)
+        return table[x]
+
+    if len(target_values) == 0:
+        return []
+    # first find an upper bound for the largest target
+    max_target_value = max(target_values)
+    upper_bound = 1
+    num_iterations = 0
+    last_val = None
+    while True:
+        new_val = evaluate(upper_bound)
+        if new_val > max_target_value:
+            break
+        upper_bound *= 2
+        num_iterations += 1
+        if num_iterations > max_iterations:
+            break
+        if last_val is not None:
+            if new_val < last_val:
+                # fails to be monotonically increasing
+                break
+        last_val = new_val
+    # then do a binary search for each target
+    ret: List[float] = [0] * len(target_values)
+    for i in np.argsort(target_values):
+        target_value = target_values[i]
+        xs = sorted(table.keys())
+        upper = next((x for x in xs if table[x] >= target_value), None)
+        if upper is None:
+            ret[i] = xs[-1]
+            continue
+        lower = max((x for x in xs if x < upper and table[x] < target_value), default=0)
+        num_iterations = 0
+        while upper - lower > tolerance:
+            candidate = (upper + lower) / 2
+            if evaluate(candidate) < target_value:
+                lower = candidate
+            else:
+                upper = candidate
+            num_iterations += 1
+            if num_iterations > max_iterations:
+                break
+        ret[i] = (upper + lower) / 2
+    return ret
+
+
+def _monotonic_binary_search_multichannel(
+    func: Callable[[np.ndarray], np.ndarray],
+    target_value: Union[float, np.ndarray],
+    num_channels: int,
+    max_iterations: int,
+    tolerance: float,
+) -> np.ndarray:
+    """
+    Vectorized version of _monotonic_binary_search (ascending case) that
+    searches one value per channel, evaluating all channels in each call
 
+    Parameters
+    ----------
+    func : callable
+        Maps an array of per-channel values to an array of per-channel
+        outputs, each assumed to be monotonically increasing
+    target_value : float or np.ndarray
+        The target value, shared by all channels or per channel
+    num_channels : int
+        The number of channels
+    max_iterations : int
+        The maximum number of iterations
+    tolerance : float
+        The tolerance for the width of the search interval
+
+    Returns
+    -------
+    np.ndarray
+        The per-channel values
+    """
+    num_iterations = 0
+    # first find an upper bound for each channel
+    upper_bound = np.ones(num_channels)
+    done = np.zeros(num_channels, dtype=bool)
+    last_val = None
+    while True:
+        new_val = func(upper_bound)
+        done |= new_val > target_value
+        if last_val is not None:
+            # fails to be monotonically increasing
+            done |= new_val < last_val
+        if np.all(done):
+            break
+        upper_bound = np.where(done, upper_bound, upper_bound * 2)
+        num_iterations += 1
+        if num_iterations > max_iterations:
+            return upper_bound
+        last_val = new_val
+    # then do a binary search on all channels at once
+    lower_bound = np.zeros(num_channels)
+    while np.max(upper_bound - lower_bound) > tolerance:
+        candidate = (upper_bound + lower_bound) / 2
+        below = func(candidate) < target_value
+        lower_bound = np.where(below, candidate, lower_bound)
+        upper_bound = np.where(below, upper_bound, candidate)
+        num_iterations += 1
+        if num_iterations > max_iterations:
+            break
+    return (upper_bound + lower_bound) / 2
 
-def zlib_compress(data: bytes) -> bytes:
-    import zlib
-    return zlib.compress(data, level=6)
 
+def zlib_compress(data: Union[bytes, np.ndarray]) -> bytes:
+    return get_lossless_backend('zlib', level=6).compress(data)
 
-def zstandard_compress(data: bytes) -> bytes:
-    import zstandard as zstd
-    cctx = zstd.ZstdCompressor(level=12)
-    return cctx.compress(data)
 
+def zstandard_compress(data: Union[bytes, np.ndarray]) -> bytes:
+    return get_lossless_backend('zstd', level=12).compress(data)
 
-def estimate_noise_level(array: np.ndarray, *, sampling_frequency: float) -> float:
-    array_filtered = highpass_filter(array, sampling_frequency=sampling_frequency, lowcut=300)
-    MAD = float(np.median(np.abs(array_filtered - np.median(array_filtered))) / 0.6745)
-    return MAD
 
 if __name__ == '__main__':
     import matplotlib.pyplot as plt
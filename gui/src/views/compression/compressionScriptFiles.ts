@@ -0,0 +1,17 @@
+import coefficient_cache_py from "../../content/scripts/coefficient_cache.py?raw";
+import filters_py from "../../content/scripts/filters.py?raw";
+import lossless_py from "../../content/scripts/lossless.py?raw";
+import noise_level_py from "../../content/scripts/noise_level.py?raw";
+import quantization_py from "../../content/scripts/quantization.py?raw";
+import rate_distortion_py from "../../content/scripts/rate_distortion.py?raw";
+
+// Python modules imported by compression.py. They are shipped next to the
+// script (in the working directory) so they can be imported directly.
+export const compressionScriptFiles: { [filename: string]: string } = {
+  "coefficient_cache.py": coefficient_cache_py,
+  "filters.py": filters_py,
+  "lossless.py": lossless_py,
+  "noise_level.py": noise_level_py,
+  "quantization.py": quantization_py,
+  "rate_distortion.py": rate_distortion_py,
+};
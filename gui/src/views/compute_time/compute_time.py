@@ -1,7 +1,24 @@
+from typing import Callable, Dict, List, Sequence, Union
 import numpy as np
 import pywt
 import time
 
+# Stages of the compression pipeline covered by run_benchmark_suite
+benchmark_stages = [
+    'filter',
+    'transform',
+    'quantize_search',
+    'entropy',
+    'zlib',
+    'zstd',
+    'lzma',
+    'arithmetic',
+    'reconstruction',
+]
+
+# Version of the JSON written by run_benchmark_suite
+benchmark_format_version = 1
+
 def generate_test_signal(*, num_samples, num_vectors):
     """Generate a 2D test signal for benchmarking"""
     t = np.linspace(0, 1, num_samples)
@@ -14,66 +31,285 @@ def generate_test_signal(*, num_samples, num_vectors):
         signals.append(signal)
     return np.array(signals)
 
-def benchmark_wavelet_transform(wavelet_name, signal):
+def time_function(func: Callable[[], object], *, num_trials: int = 7, num_warmup: int = 1) -> dict:
+    """Time repeated calls of func with perf_counter_ns
+
+    The warmup calls are not timed (they fill caches and trigger lazy
+    imports). Returns the median, interquartile range and minimum of the
+    trial times in seconds.
+    """
+    for _ in range(num_warmup):
+        func()
+    times_ns = []
+    for _ in range(num_trials):
+        start = time.perf_counter_ns()
+        func()
+        times_ns.append(time.perf_counter_ns() - start)
+    times = np.array(times_ns) / 1e9
+    q25, median, q75 = np.percentile(times, [25, 50, 75])
+    return {
+        'median_sec': float(median),
+        'iqr_sec': float(q75 - q25),
+        'q25_sec': float(q25),
+        'q75_sec': float(q75),
+        'min_sec': float(np.min(times)),
+        'num_trials': num_trials,
+        'num_warmup': num_warmup,
+    }
+
+def benchmark_wavelet_transform(wavelet_name, signal, *, num_trials=5, num_warmup=1):
     """Benchmark wavelet transform computation time for 2D signal"""
     if wavelet_name != 'fourier':
-        # Time decomposition
-        dec_start_time = time.time()
         coeffs = pywt.wavedec(signal, wavelet_name)
-        dec_end_time = time.time()
-
-        # Time reconstruction
-        rec_start_time = time.time()
-        _ = pywt.waverec(coeffs, wavelet_name)
-        rec_end_time = time.time()
-
-        dec_time = dec_end_time - dec_start_time
-        rec_time = rec_end_time - rec_start_time
-        return dec_time, rec_time
+        dec = time_function(lambda: pywt.wavedec(signal, wavelet_name), num_trials=num_trials, num_warmup=num_warmup)
+        rec = time_function(lambda: pywt.waverec(coeffs, wavelet_name), num_trials=num_trials, num_warmup=num_warmup)
     else:  # fourier
-        # Time decomposition
-        dec_start_time = time.time()
         coeffs = np.fft.rfft(signal)
-        dec_end_time = time.time()
+        dec = time_function(lambda: np.fft.rfft(signal), num_trials=num_trials, num_warmup=num_warmup)
+        rec = time_function(lambda: np.fft.irfft(coeffs), num_trials=num_trials, num_warmup=num_warmup)
+    return dec, rec
 
-        # Time reconstruction
-        rec_start_time = time.time()
-        _ = np.fft.irfft(coeffs)
-        rec_end_time = time.time()
+def benchmark_compute_time(*, wavelet_name, num_samples, num_trials=5, num_warmup=1):
+    """Main function to run benchmarks and return results
 
-        dec_time = dec_end_time - dec_start_time
-        rec_time = rec_end_time - rec_start_time
-
-        return dec_time, rec_time
-
-def benchmark_compute_time(*, wavelet_name, num_samples):
-    """Main function to run benchmarks and return results"""
-    num_trials = 5
+    Times are medians over num_trials (after num_warmup untimed runs) of
+    transforming 10 vectors at once, divided by the number of vectors, so
+    they are per vector of num_samples samples.
+    """
     num_vectors = 10
 
     # Generate test signal
     signal = generate_test_signal(num_samples=num_samples, num_vectors=num_vectors)
 
-    dec_times = []
-    rec_times = []
-    for _ in range(num_trials):
-        dec_time, rec_time = benchmark_wavelet_transform(wavelet_name, signal)
-        dec_times.append(dec_time / num_vectors)
-        rec_times.append(rec_time / num_vectors)
+    dec, rec = benchmark_wavelet_transform(wavelet_name, signal, num_trials=num_trials, num_warmup=num_warmup)
 
     # Return results in format suitable for plotting
     return {
         'num_samples': num_samples,
-        'dec_computation_time_msec': np.mean(dec_times) * 1000,
-        'rec_computation_time_msec': np.mean(rec_times) * 1000,
+        'dec_computation_time_msec': dec['median_sec'] / num_vectors * 1000,
+        'rec_computation_time_msec': rec['median_sec'] / num_vectors * 1000,
+        'dec_computation_time_iqr_msec': dec['iqr_sec'] / num_vectors * 1000,
+        'rec_computation_time_iqr_msec': rec['iqr_sec'] / num_vectors * 1000,
+        'dec_throughput_msps': num_samples * num_vectors / dec['median_sec'] / 1e6,
+        'rec_throughput_msps': num_samples * num_vectors / rec['median_sec'] / 1e6,
         'wavelet_name': wavelet_name
     }
 
+def run_benchmark_suite(*,
+    num_samples_list: Sequence[int] = (30000, 300000),
+    num_channels_list: Sequence[int] = (1, 8),
+    wavelet_name: str = 'db4',
+    target_nrmse: float = 0.3,
+    stages: Union[List[str], None] = None,
+    num_trials: int = 7,
+    num_warmup: int = 1,
+    output_path: Union[str, None] = None
+) -> dict:
+    """Time each stage of the compression pipeline at several sizes
+
+    The signal is synthetic (seeded noise plus a slow oscillation, int16,
+    samples x channels) and sampled at 30 kHz. The inputs of each stage are
+    prepared outside the timed calls. Each result holds the timing of
+    time_function and the throughput in megasamples per second (all
+    channels). Stages whose dependencies are not available are reported
+    with the reason they were skipped. With output_path, the results are
+    also written there as JSON (see find_benchmark_regressions).
+    """
+    import platform
+    import sys
+
+    stages = benchmark_stages if stages is None else stages
+    for stage in stages:
+        if stage not in benchmark_stages:
+            raise ValueError(f'Unknown benchmark stage: {stage}')
+    results = []
+    for num_samples in num_samples_list:
+        for num_channels in num_channels_list:
+            signal = _generate_pipeline_signal(num_samples=num_samples, num_channels=num_channels)
+            inputs: Dict[str, object] = {}
+            for stage in stages:
+                result = {
+                    'stage': stage,
+                    'num_samples': num_samples,
+                    'num_channels': num_channels,
+                    'wavelet_name': wavelet_name,
+                }
+                try:
+                    func = _get_stage_function(
+                        stage,
+                        signal=signal,
+                        wavelet_name=wavelet_name,
+                        target_nrmse=target_nrmse,
+                        inputs=inputs,
+                    )
+                except ImportError as e:
+                    result['skipped'] = str(e)
+                    results.append(result)
+                    continue
+                timing = time_function(func, num_trials=num_trials, num_warmup=num_warmup)
+                result.update(timing)
+                result['throughput_msps'] = num_samples * num_channels / timing['median_sec'] / 1e6
+                results.append(result)
+                print(f'{stage:>15} {num_samples:>9} x {num_channels:<3} {timing["median_sec"] * 1000:10.2f} ms (IQR {timing["iqr_sec"] * 1000:.2f} ms) {result["throughput_msps"]:10.2f} MS/s')
+    ret = {
+        'format_version': benchmark_format_version,
+        'environment': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pywt': pywt.__version__,
+        },
+        'config': {
+            'num_samples_list': list(num_samples_list),
+            'num_channels_list': list(num_channels_list),
+            'wavelet_name': wavelet_name,
+            'target_nrmse': target_nrmse,
+            'num_trials': num_trials,
+            'num_warmup': num_warmup,
+        },
+        'results': results,
+    }
+    if output_path is not None:
+        import json
+        with open(output_path, 'w') as f:
+            json.dump(ret, f, indent=2)
+    return ret
+
+def find_benchmark_regressions(baseline: dict, current: dict, *, max_slowdown: float = 0.2) -> List[dict]:
+    """Results of current that are slower than in baseline
+
+    Results are matched by stage, size and wavelet. A result regresses when
+    its median is more than max_slowdown (relative) above the baseline
+    median and the difference is also larger than the interquartile ranges
+    of both runs, so that timing noise alone does not fail a check.
+    """
+    def key(r):
+        return (r['stage'], r['num_samples'], r['num_channels'], r['wavelet_name'])
+
+    baseline_results = {key(r): r for r in baseline['results'] if 'median_sec' in r}
+    ret = []
+    for r in current['results']:
+        b = baseline_results.get(key(r))
+        if b is None or 'median_sec' not in r:
+            continue
+        difference = r['median_sec'] - b['median_sec']
+        if difference > max_slowdown * b['median_sec'] and difference > max(r['iqr_sec'], b['iqr_sec']):
+            ret.append({
+                'stage': r['stage'],
+                'num_samples': r['num_samples'],
+                'num_channels': r['num_channels'],
+                'wavelet_name': r['wavelet_name'],
+                'baseline_median_sec': b['median_sec'],
+                'median_sec': r['median_sec'],
+                'slowdown': difference / b['median_sec'],
+            })
+    return ret
+
+def _generate_pipeline_signal(*, num_samples, num_channels, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_samples) / 30000
+    slow = 200 * np.sin(2 * np.pi * (8 + rng.random(num_channels)) * t[:, None])
+    return (rng.standard_normal((num_samples, num_channels)) * 100 + slow).astype(np.int16)
+
+def _import_pipeline_modules():
+    # compression.py and the shared modules (it adds content/scripts to the
+    # path itself), and the arithmetic coder at the root of the repository
+    import os
+    import sys
+    here = os.path.dirname(os.path.abspath(__file__))
+    for path in (os.path.join(here, '..', 'compression'), os.path.join(here, '..', '..', '..', '..')):
+        if path not in sys.path:
+            sys.path.append(path)
+    import compression
+    return compression
+
+def _get_stage_function(stage, *, signal, wavelet_name, target_nrmse, inputs):
+    # a function of no arguments that runs the stage; the inputs of later
+    # stages are computed once and kept in inputs
+    compression = _import_pipeline_modules()
+    sampling_frequency = 30000
+    if 'filtered' not in inputs:
+        inputs['filtered'] = compression.bandpass_filter(signal, sampling_frequency=sampling_frequency, lowcut=300, highcut=6000).astype(np.int16)
+    filtered = inputs['filtered']
+    original = filtered[:, 0] if filtered.shape[1] == 1 else filtered
+    if 'coeffs' not in inputs:
+        inputs['coeffs'] = compression.compute_coeffs(original, wavelet_name=wavelet_name)
+        inputs['noise_level'] = compression.estimate_noise_level(original, sampling_frequency=sampling_frequency)
+        inputs['quant_scale_factor'] = compression.find_quant_scale_factor(
+            original=original,
+            coeffs=inputs['coeffs'],
+            wavelet_name=wavelet_name,
+            estimated_noise_level=inputs['noise_level'],
+            target_nrmse=target_nrmse,
+            fast_search=True,
+        )
+        inputs['coeffs_quantized'] = compression.quantize_coeffs(inputs['coeffs'], inputs['quant_scale_factor'])
+        inputs['buffer'] = np.concatenate(inputs['coeffs_quantized'])
+    coeffs = inputs['coeffs']
+    coeffs_quantized = inputs['coeffs_quantized']
+    buffer = inputs['buffer']
+
+    if stage == 'filter':
+        return lambda: compression.bandpass_filter(signal, sampling_frequency=sampling_frequency, lowcut=300, highcut=6000)
+    elif stage == 'transform':
+        return lambda: compression.compute_coeffs(original, wavelet_name=wavelet_name)
+    elif stage == 'quantize_search':
+        return lambda: compression.find_quant_scale_factor(
+            original=original,
+            coeffs=coeffs,
+            wavelet_name=wavelet_name,
+            estimated_noise_level=inputs['noise_level'],
+            target_nrmse=target_nrmse,
+            fast_search=True,
+        )
+    elif stage == 'entropy':
+        return lambda: compression.compute_theoretical_bits_per_sample(coeffs_quantized, per_channel=original.ndim == 2)
+    elif stage == 'zlib':
+        return lambda: compression.zlib_compress(buffer)
+    elif stage == 'zstd':
+        # creates the compressor context, and fails here if zstandard is missing
+        compression.zstandard_compress(buffer[:0])
+        return lambda: compression.zstandard_compress(buffer)
+    elif stage == 'lzma':
+        backend = compression.get_lossless_backend('lzma', level=6)
+        return lambda: backend.compress(buffer)
+    elif stage == 'arithmetic':
+        from arithmetic_compressor import ArithmeticCompressor
+        compressor = ArithmeticCompressor(buffer)
+        return lambda: compressor.encode(buffer)
+    elif stage == 'reconstruction':
+        quant_scale_factor = inputs['quant_scale_factor']
+        return lambda: compression.reconstruct_from_coeffs(coeffs_quantized, wavelet_name=wavelet_name, num_samples=original.shape[0]) * quant_scale_factor
+    else:
+        raise ValueError(f'Unknown benchmark stage: {stage}')
+
 if __name__ == '__main__':
-    # Example usage
-    result = benchmark_compute_time(
-        wavelet_name='db1',
-        num_samples=int(1e6)
+    import argparse
+    import json
+    import sys
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the compression pipeline')
+    parser.add_argument('--num-samples', type=int, nargs='+', default=[30000, 300000])
+    parser.add_argument('--num-channels', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--wavelet', default='db4')
+    parser.add_argument('--stages', nargs='+', default=None, choices=benchmark_stages)
+    parser.add_argument('--num-trials', type=int, default=7)
+    parser.add_argument('--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None, help='fail if slower than the results in this JSON file')
+    parser.add_argument('--max-slowdown', type=float, default=0.2)
+    args = parser.parse_args()
+    results = run_benchmark_suite(
+        num_samples_list=args.num_samples,
+        num_channels_list=args.num_channels,
+        wavelet_name=args.wavelet,
+        stages=args.stages,
+        num_trials=args.num_trials,
+        output_path=args.output
     )
-    print(f"Decomposition time: {result['dec_computation_time_msec']:.1f} milliseconds")
-    print(f"Reconstruction time: {result['rec_computation_time_msec']:.1f} milliseconds")
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_benchmark_regressions(baseline, results, max_slowdown=args.max_slowdown)
+        for r in regressions:
+            print(f"Regression: {r['stage']} {r['num_samples']} x {r['num_channels']}: {r['baseline_median_sec'] * 1000:.2f} ms -> {r['median_sec'] * 1000:.2f} ms (+{r['slowdown'] * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
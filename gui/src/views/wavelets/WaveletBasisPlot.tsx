@@ -24,7 +24,7 @@ basis_wavelets = get_basis_wavelets(
   level=${level},
   wavelet='${wavelet}'
 )
-{'basis_wavelets': basis_wavelets}
+{'basis_wavelets': basis_wavelets.tolist()}
 `;
   const { result: r } = usePyodideResult(code);
   if (!r?.basis_wavelets) {
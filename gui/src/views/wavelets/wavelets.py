@@ -1,4 +1,5 @@
-from typing import List
+from functools import lru_cache
+from typing import List, Tuple
 import numpy as np
 import pywt
 
@@ -12,16 +13,34 @@ def get_coeff_sizes(*, n: int, wavelet: str):
     return coeff_sizes
 
 
-def get_basis_wavelets(*, coeff_sizes: List[int], level: int, wavelet: str):
-    basis_wavelets = []
-    for offset in range(coeff_sizes[level]):
-        coeffs = []
-        for i in range(len(coeff_sizes)):
-            coeffs.append(np.zeros(coeff_sizes[i]))
-        coeffs[level][offset] = 1
-        y = pywt.waverec(coeffs, wavelet, mode=wavelet_extension_mode)
-        basis_wavelets.append(y.tolist())
-    return basis_wavelets
+def get_synthesis_matrix(*, coeff_sizes: List[int], wavelet: str, mode: str = wavelet_extension_mode) -> np.ndarray:
+    """
+    The (coefficients x samples) float32 matrix whose k-th row is the signal
+    reconstructed from the k-th coefficient alone, with the coefficients of
+    all levels concatenated in the order of pywt.wavedec
+
+    The matrix is computed with a single waverec along the last axis of the
+    identity (split into levels) and cached per (coeff_sizes, wavelet, mode),
+    which is the same as per (n, wavelet, mode). It is read-only.
+    """
+    return _get_synthesis_matrix(tuple(coeff_sizes), wavelet, mode)
+
+
+@lru_cache(maxsize=8)
+def _get_synthesis_matrix(coeff_sizes: Tuple[int, ...], wavelet: str, mode: str) -> np.ndarray:
+    # pywt transforms float32 input in single precision
+    identity = np.eye(sum(coeff_sizes), dtype=np.float32)
+    coeffs = np.split(identity, np.cumsum(coeff_sizes)[:-1], axis=1)
+    ret = pywt.waverec(coeffs, wavelet, mode=mode, axis=-1)
+    ret.flags.writeable = False
+    return ret
+
+
+def get_basis_wavelets(*, coeff_sizes: List[int], level: int, wavelet: str) -> np.ndarray:
+    """(coefficients at the level x samples) float32 array of the basis wavelets"""
+    start = sum(coeff_sizes[:level])
+    synthesis_matrix = get_synthesis_matrix(coeff_sizes=coeff_sizes, wavelet=wavelet)
+    return synthesis_matrix[start:start + coeff_sizes[level]]
 
 
 if __name__ == '__main__':
@@ -33,4 +52,4 @@ if __name__ == '__main__':
         level=0,
         wavelet=wavelet
     )
-    print([len(a) for a in X])
+    print(X.shape)